@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from instruments import Instrument
+from instruments import CommandGroup
+from lockin import Lockin
+from oscilloscope import Oscilloscope
+from itc4001 import ITC4001
+
+
+def _is_data_descriptor(attr):
+    return hasattr(attr, '__set__') or hasattr(attr, '__delete__')
+
+
+class _AsyncCommandGroup(object):
+    '''
+    Awaitable view of a CommandGroup.
+
+    Methods become coroutines and properties are awaitables (or read and
+    written with get and set). The group itself is only looked up in the
+    executor of the owner instrument, so lazy panels are built there.
+    '''
+
+    def __init__(self, owner, name, cls):
+        self._owner = owner
+        self._name = name
+        self._cls = cls
+
+    def _group(self):
+        return getattr(self._owner._sync, self._name)
+
+    def __getattr__(self, name):
+        attr = getattr(self._cls, name, None)
+        if attr is None or _is_data_descriptor(attr):
+            return self.get(name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def method(*args, **kwargs):
+            return await self._owner._run(
+                lambda: getattr(self._group(), name)(*args, **kwargs))
+        return method
+
+    def __setattr__(self, name, value):
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            raise AttributeError('Use await set({!r}, value)'.format(name))
+
+    async def get(self, name):
+        return await self._owner._run(lambda: getattr(self._group(), name))
+
+    async def set(self, name, value):
+        return await self._owner._run(
+            lambda: setattr(self._group(), name, value))
+
+
+class AsyncInstrument(object):
+    '''
+    Asyncio counterpart of Instrument.
+
+    Wraps a blocking instrument and runs its VISA I/O in a single-thread
+    executor owned by the resource. Calls to one instrument stay ordered
+    while different instruments run concurrently on the same event loop.
+    '''
+
+    _instrument = Instrument
+
+    def __init__(self, inst=None, executor=None, **kwargs):
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=1)
+        if inst is None:
+            inst = self._instrument(**kwargs)
+        self._executor = executor
+        self._sync = inst
+
+    @classmethod
+    async def open(cls, **kwargs):
+        """ Open the instrument without blocking the event loop """
+        executor = ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_running_loop()
+        try:
+            inst = await loop.run_in_executor(
+                executor, functools.partial(cls._instrument, **kwargs))
+        except BaseException:
+            executor.shutdown(wait=False)
+            raise
+        return cls(inst, executor)
+
+    @property
+    def sync(self):
+        return self._sync
+
+    def __getattr__(self, name):
+        cls = type(self._sync)
+        panels = getattr(cls, '_panel_classes', dict())
+        if name in panels:
+            return _AsyncCommandGroup(self, name, panels[name])
+        if _is_data_descriptor(getattr(cls, name, None)):
+            return self._run(getattr, self._sync, name)
+
+        attr = getattr(self._sync, name)
+        if isinstance(attr, CommandGroup):
+            return _AsyncCommandGroup(self, name, type(attr))
+        if not callable(attr):
+            return attr
+        return self._wrap(attr)
+
+    def _run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return loop.run_in_executor(self._executor,
+                                    functools.partial(func, *args, **kwargs))
+
+    def _wrap(self, func):
+        @functools.wraps(func)
+        async def method(*args, **kwargs):
+            return await self._run(func, *args, **kwargs)
+        return method
+
+    async def write(self, command, termination=None, encoding=None,
+                    log=True):
+        return await self._run(self._sync.write, command,
+                               termination, encoding, log)
+
+    async def query(self, command, delay=None, log=True):
+        return await self._run(self._sync.query, command, delay, log)
+
+    async def query_ascii_values(self, command, converter='f', separator=',',
+                                 container=list, delay=None, log=True):
+        return await self._run(self._sync.query_ascii_values, command,
+                               converter, separator, container, delay, log)
+
+    async def query_binary_values(self, command, datatype='f',
+                                  is_big_endian=False, container=list,
+                                  delay=None, header_fmt='ieee', log=True):
+        return await self._run(self._sync.query_binary_values, command,
+                               datatype, is_big_endian, container, delay,
+                               header_fmt, log)
+
+    async def close(self):
+        """ Close the instrument in its worker, then stop the worker """
+        try:
+            await self._run(self._sync.close)
+        finally:
+            # The close was the last job queued, nothing left to wait for
+            self._executor.shutdown(wait=False)
+
+
+class AsyncLockin(AsyncInstrument):
+    _instrument = Lockin
+
+
+class AsyncOscilloscope(AsyncInstrument):
+    _instrument = Oscilloscope
+
+
+class AsyncITC4001(AsyncInstrument):
+    _instrument = ITC4001
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+'''
+Benchmarks of command throughput, sweeps and data paths.
+
+Runs against the simulator backends and prints one row per measurement
+as CSV or JSON lines, so results of different versions can be compared.
+
+    python benchmarks.py --latency 0.001 --format json > bench.jsonl
+'''
+
+import argparse
+import csv
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from instrument_group import InstrumentGroup
+from lockin import Lockin
+from oscilloscope import Oscilloscope
+from simulator import SimSR830
+from simulator import SimTDS
+
+FIELDS = ('benchmark', 'case', 'calls', 'seconds', 'per_call', 'rate')
+
+
+def timeit(func, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        func()
+    return time.perf_counter() - start
+
+
+def result(benchmark, case, calls, seconds):
+    return {'benchmark': benchmark, 'case': case, 'calls': calls,
+            'seconds': seconds, 'per_call': seconds / calls,
+            'rate': calls / seconds if seconds > 0 else float('inf')}
+
+
+def bench_commands(lockin, calls):
+    rows = list()
+    cases = (('query', lambda: lockin.query('FREQ?', log=False)),
+             ('query+log', lambda: lockin.query('FREQ?')),
+             ('write', lambda: lockin.write('PHAS 0', log=False)),
+             ('write+log', lambda: lockin.write('PHAS 0')))
+    for case, func in cases:
+        rows.append(result('commands', case, calls, timeit(func, calls)))
+
+    lockin.log_mode(buffered=True)
+    func = (lambda: lockin.query('FREQ?'))
+    rows.append(result('commands', 'query+buffered log', calls,
+                       timeit(func, calls)))
+    lockin.log_mode(buffered=False)
+
+    func = (lambda: lockin.write('PHAS 0', log=False))
+    lockin.error_policy(10)
+    rows.append(result('commands', 'write, errors every 10', calls,
+                       timeit(func, calls)))
+    lockin.error_policy('command')
+    with lockin.deferred_errors():
+        rows.append(result('commands', 'write, deferred errors', calls,
+                           timeit(func, calls)))
+    return rows
+
+
+def bench_snap(lockin, calls):
+    rows = list()
+    adq = lockin.adquisition
+    plan = adq.plan('X', 'Y', 'R', 'T')
+    data = np.zeros([calls, 4])
+    cases = (('read_multiple', lambda: adq.read_multiple(
+                 'X', 'Y', 'R', 'T', log=False)),
+             ('plan', plan.read))
+    for case, func in cases:
+        rows.append(result('snap', case, calls, timeit(func, calls)))
+
+    with lockin.deferred_errors():
+        start = time.perf_counter()
+        for i in range(calls):
+            plan.read_into(data, i)
+        seconds = time.perf_counter() - start
+    rows.append(result('snap', 'plan, deferred errors', calls, seconds))
+    return rows
+
+
+def bench_sweep(lockin, points):
+    rows = list()
+    adq = lockin.adquisition
+    cases = (('no delay', lambda: adq.sweep_freq(
+                 900, 1100, n=points, delay=0, log=False)),
+             ('auto delay', lambda: adq.sweep_freq(
+                 900, 1100, n=points, delay='auto', log=False)),
+             ('adaptive', lambda: adq.sweep_freq_adaptive(
+                 900, 1100, n=max(points // 8, 2), max_points=points,
+                 delay='auto', log=False)))
+    for case, func in cases:
+        rows.append(result('sweep_freq', case, 1, timeit(func, 1)))
+    return rows
+
+
+def bench_buffer(lockin, sim, calls):
+    rows = list()
+    adq = lockin.adquisition
+    sim.fill_buffer(16383)
+    for mode in ('ascii', 'binary', 'compact'):
+        func = (lambda: adq.buffer_read(1, 0, 16383, mode=mode))
+        rows.append(result('buffer_read 16383', mode, calls,
+                           timeit(func, calls)))
+    return rows
+
+
+def bench_curve(scope, calls):
+    rows = list()
+    cases = (('cached preamble', lambda: scope.get_curve(log=False)),
+             ('always preamble', lambda: scope.get_curve(
+                 auto_wfmpre='always', log=False)),
+             ('logged', lambda: scope.get_curve()),
+             ('4 channels 16 bit', lambda: scope.get_curves(log=False)))
+    for case, func in cases:
+        rows.append(result('get_curve', case, calls, timeit(func, calls)))
+    return rows
+
+
+def bench_save(lockin, steps, calls):
+    rows = list()
+    data = list(range(100))
+    for step in range(steps):
+        seconds = timeit(lambda: lockin.save(data), calls)
+        stored = (step + 1) * calls
+        rows.append(result('save', '{} stored'.format(stored), calls,
+                           seconds))
+    return rows
+
+
+def bench_group(path, latency, bandwidth, calls, size=4):
+    rows = list()
+    lockins = [Lockin(sim_mode=SimSR830(latency, bandwidth, seed=i),
+                      path=path) for i in range(size)]
+    group = InstrumentGroup(lockins)
+
+    def sequential():
+        for lockin in lockins:
+            lockin.adquisition.read_multiple('X', 'Y', 'R', 'T', log=False)
+
+    cases = (('{} sequential'.format(size), sequential),
+             ('{} group'.format(size), lambda: group.read_multiple(
+                 'X', 'Y', 'R', 'T')))
+    for case, func in cases:
+        rows.append(result('read_multiple', case, calls,
+                           timeit(func, calls)))
+
+    group.close(instruments=True)
+    return rows
+
+
+def _run(path, latency, bandwidth, calls, points, steps, profile):
+    sim = SimSR830(latency=latency, bandwidth=bandwidth, seed=0)
+    lockin = Lockin(sim_mode=sim, path=path)
+    scope = Oscilloscope(sim_mode=SimTDS(latency, bandwidth, seed=0),
+                         path=path)
+
+    # 1 ms time constant keeps the settling waits short
+    lockin.write('OFLT 4', log=False)
+
+    if profile:
+        scope.profile(profiler=lockin.profile())
+
+    rows = list()
+    rows += bench_commands(lockin, calls)
+    rows += bench_snap(lockin, calls)
+    rows += bench_sweep(lockin, points)
+    rows += bench_buffer(lockin, sim, max(calls // 20, 1))
+    rows += bench_curve(scope, max(calls // 4, 1))
+    rows += bench_save(lockin, steps, calls)
+    rows += bench_group(path, latency, bandwidth, max(calls // 4, 1))
+
+    if profile:
+        print(lockin.profile().table(), file=sys.stderr)
+
+    lockin.close()
+    scope.close()
+    return rows
+
+
+def run(latency=0.0, bandwidth=None, calls=200, points=100, steps=5,
+        profile=False):
+    path = tempfile.mkdtemp()
+    try:
+        return _run(path, latency, bandwidth, calls, points, steps,
+                    profile)
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='seconds per bus transaction')
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='transfer rate in bytes per second')
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--points', type=int, default=100)
+    parser.add_argument('--format', choices=('csv', 'json'), default='csv')
+    parser.add_argument('--profile', action='store_true',
+                        help='print per-command latency to stderr')
+    args = parser.parse_args(argv)
+
+    rows = run(args.latency, args.bandwidth, args.calls, args.points,
+               profile=args.profile)
+
+    if args.format == 'json':
+        for row in rows:
+            print(json.dumps(row))
+    else:
+        writer = csv.DictWriter(sys.stdout, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class InstrumentGroup(object):
+    '''
+    Send the same acquisition to several instruments at once.
+
+    Instruments are grouped by interface (GPIB0, ASRL3, ...) and each
+    interface gets one worker, so instruments on independent buses are
+    read concurrently and the ones sharing a bus one after the other.
+    Results are stacked in instrument order with the time of each read.
+    '''
+
+    def __init__(self, instruments):
+        self._instruments = list(instruments)
+        self._interfaces = OrderedDict()
+        for i, inst in enumerate(self._instruments):
+            key = self._interface(inst)
+            self._interfaces.setdefault(key, list()).append(i)
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(len(self._interfaces), 1))
+
+    def _interface(self, inst):
+        resource = str(inst._resource)
+        if '::' in resource:
+            return resource.split('::')[0].upper()
+        # Simulators and unknown resources have a bus of their own
+        return id(inst)
+
+    def __len__(self):
+        return len(self._instruments)
+
+    def __iter__(self):
+        return iter(self._instruments)
+
+    def __getitem__(self, index):
+        return self._instruments[index]
+
+    def _run(self, indexes, func, args, kwargs):
+        answers = list()
+        for i in indexes:
+            start = time.time()
+            answer = func(self._instruments[i], *args, **kwargs)
+            answers.append(((start + time.time()) / 2, answer))
+        return answers
+
+    def call(self, func, *args, **kwargs):
+        """
+        Run func(instrument, *args, **kwargs) on every instrument.
+
+        Returns the times (midpoint of each call) and the answers, both
+        in instrument order.
+        """
+        futures = [(indexes, self._executor.submit(self._run, indexes,
+                                                   func, args, kwargs))
+                   for indexes in self._interfaces.values()]
+
+        times = np.zeros(len(self._instruments), dtype=float)
+        answers = [None] * len(self._instruments)
+        for indexes, future in futures:
+            for i, (t, answer) in zip(indexes, future.result()):
+                times[i] = t
+                answers[i] = answer
+        return times, answers
+
+    def query_values(self, command, log=False):
+        """ Same query to every instrument, (instruments, values) array """
+        times, answers = self.call(
+            lambda inst: inst.query_ascii_values(command, log=log))
+        return times, np.array(answers, dtype=float)
+
+    def read_multiple(self, *params, log=False):
+        """ SNAP? of params on every lock-in, (instruments, params) array """
+        times, answers = self.call(
+            lambda inst: inst.adquisition.read_multiple(*params, log=log))
+        return times, np.array(answers, dtype=float)
+
+    def read_value(self, value='R', log=False):
+        """ One output of every lock-in, (instruments,) array """
+        times, answers = self.call(
+            lambda inst: inst.adquisition.read_value(value, log=log))
+        return times, np.array(answers, dtype=float)
+
+    def close(self, instruments=False):
+        """ Stop the workers, and close the instruments if asked """
+        self._executor.shutdown(wait=True)
+        if instruments:
+            for inst in self._instruments:
+                inst.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,13 +1,99 @@
 # -*- coding: utf-8 -*-
 
+import collections
+import contextlib
+import itertools
+import os
+import threading
 import numpy as np
-import visa
 import time
+from concurrent.futures import ThreadPoolExecutor
 from tools import FileTools as FT
 from tools import PromptTools as PT
 from tools import LogTools as LT
+from tools import DataStore
+from tools import Profiler
+from simulator import SimDevice
+from simulator import SIMULATORS
+
+try:
+    from pyvisa.util import from_ascii_block
+except ImportError:
+    from_ascii_block = None
 
 MAX_LOG_ANSWERS = 10
+MAX_UNCHECKED = 32
+
+# Seconds discovered resources and IDN strings are reused
+RESOURCE_TTL = 300.0
+
+_managers = dict()
+_resources = dict()
+_idns = dict()
+_scan_locks = collections.defaultdict(threading.Lock)
+_discovery_lock = threading.Lock()
+
+# Sessions opened by this process, keeps store files apart
+_sessions = itertools.count()
+
+
+def resource_manager(backend='@py'):
+    """ Process-wide ResourceManager shared by every instrument """
+    with _discovery_lock:
+        if backend not in _managers:
+            # The VISA library is loaded with the first real instrument
+            import visa
+            _managers[backend] = visa.ResourceManager(backend)
+        return _managers[backend]
+
+
+def list_resources(query='?*::INSTR', backend='@py', ttl=RESOURCE_TTL):
+    """ Resources matching query, scanning the interfaces once per ttl """
+    rm = resource_manager(backend)
+    key = (backend, query)
+    with _discovery_lock:
+        lock = _scan_locks[key]
+    with lock:
+        found = _resources.get(key)
+        if found is None or time.monotonic() - found[0] > ttl:
+            found = (time.monotonic(), rm.list_resources(query=query))
+            _resources[key] = found
+        return found[1]
+
+
+def cached_idn(resource, ttl=RESOURCE_TTL):
+    """ Last *IDN? answer of resource or None if unknown or expired """
+    found = _idns.get(resource)
+    if found is not None and time.monotonic() - found[0] <= ttl:
+        return found[1]
+
+
+def clear_resource_cache():
+    """ Forget discovered resources and IDN strings """
+    with _discovery_lock:
+        _resources.clear()
+        _idns.clear()
+
+
+def open_instruments(*specs, max_workers=None):
+    """
+    Open several instruments concurrently, in the order given.
+
+    Each spec is an Instrument class or a (class, kwargs) tuple. If any
+    of them fails the ones already opened are closed.
+    """
+    specs = [spec if isinstance(spec, tuple) else (spec, dict())
+             for spec in specs]
+    with ThreadPoolExecutor(max_workers or len(specs) or 1) as executor:
+        futures = [executor.submit(cls, **kwargs) for cls, kwargs in specs]
+        errors = [future.exception() for future in futures]
+
+    if any(errors):
+        for future, error in zip(futures, errors):
+            if error is None:
+                future.result().close()
+        raise next(error for error in errors if error is not None)
+    return [future.result() for future in futures]
 
 
 class SimVISA(object):
@@ -42,21 +128,133 @@ class SimVISA(object):
         pass
 
 
+class ProfiledResource(object):
+    '''
+    Wraps a VISA resource and records every transaction in a Profiler.
+
+    Reads after a raw write are attributed to the command written, so
+    direct resource access (buffer_read, get_curve) is measured too.
+    '''
+
+    def __init__(self, resource, profiler):
+        self._resource = resource
+        self._profiler = profiler
+        self._last = None
+
+    def __getattr__(self, name):
+        return getattr(self._resource, name)
+
+    def _key(self, command):
+        units = command.strip().split(';')
+        key = units[0].split(' ')[0].upper()
+        if len(units) > 1:
+            key += '+{}'.format(len(units) - 1)
+        return key
+
+    def write(self, command, termination=None, encoding=None):
+        start = time.perf_counter()
+        answer = self._resource.write(command, termination, encoding)
+        self._last = self._key(command)
+        self._profiler.record(self._last, time.perf_counter() - start,
+                              sent=len(command))
+        return answer
+
+    def write_raw(self, message):
+        start = time.perf_counter()
+        answer = self._resource.write_raw(message)
+        self._last = self._key(message.decode(errors='replace'))
+        self._profiler.record(self._last, time.perf_counter() - start,
+                              sent=len(message))
+        return answer
+
+    def _read(self, method, *args, **kwargs):
+        start = time.perf_counter()
+        data = method(*args, **kwargs)
+        self._profiler.record('{} (read)'.format(self._last),
+                              time.perf_counter() - start,
+                              received=len(data))
+        return data
+
+    def read_raw(self, *args, **kwargs):
+        return self._read(self._resource.read_raw, *args, **kwargs)
+
+    def read_bytes(self, *args, **kwargs):
+        return self._read(self._resource.read_bytes, *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        return self._read(self._resource.read, *args, **kwargs)
+
+    def query(self, command, delay=None):
+        start = time.perf_counter()
+        answer = self._resource.query(command, delay)
+        self._profiler.record(self._key(command),
+                              time.perf_counter() - start,
+                              len(command), len(answer))
+        return answer
+
+    def query_ascii_values(self, command, converter='f', separator=',',
+                           container=list, delay=None):
+        # The text goes through query to count its bytes, the parsing is
+        # left to the parser of the resource
+        parse = getattr(self._resource, 'from_ascii_block', from_ascii_block)
+        if parse is None:
+            start = time.perf_counter()
+            answer = self._resource.query_ascii_values(
+                command, converter=converter, separator=separator,
+                container=container, delay=delay)
+            self._profiler.record(self._key(command),
+                                  time.perf_counter() - start,
+                                  len(command), 0)
+            return answer
+        return parse(self.query(command, delay), converter, separator,
+                     container)
+
+    def query_binary_values(self, command, datatype='f', *args, **kwargs):
+        start = time.perf_counter()
+        answer = self._resource.query_binary_values(command, datatype,
+                                                    *args, **kwargs)
+        size = len(answer) * np.dtype(datatype).itemsize
+        self._profiler.record(self._key(command),
+                              time.perf_counter() - start,
+                              len(command), size)
+        return answer
+
+
 class Instrument():
+
+    # Commands that change settings other than their own
+    _volatile = ('*RST', '*RCL')
+
+    # A message with several queries gets one ';' separated reply (SCPI)
+    _joined_answers = True
+
+    # Default for error_policy
+    _error_policy = 'command'
+
     def __init__(self, resource=None, sim_mode=False, backend="@py",
                  query='?*::INSTR', name=None, path='./'):
 
-        if sim_mode:
+        if isinstance(sim_mode, SimDevice):
+            # Use a scripted simulator
+            self._resource = type(sim_mode).__name__
+            self._inst = sim_mode
+
+        elif isinstance(sim_mode, str):
+            # Create a scripted simulator by name (see SIMULATORS)
+            self._resource = 'Sim' + sim_mode
+            self._inst = SIMULATORS[sim_mode]()
+
+        elif sim_mode:
             # Create a simulated instrument
             self._resource = 'SimVISA'
             self._inst = SimVISA()
 
         else:
-            rm = visa.ResourceManager(backend)
+            rm = resource_manager(backend)
             # Help to find resource
             if resource is None:
 
-                available = rm.list_resources(query=query)
+                available = list_resources(query, backend)
 
                 # Filter results with the (optional) name provided
                 if name is not None:
@@ -84,6 +282,7 @@ class Instrument():
 
                 # Raise exception for negative query results
                 else:
+                    import visa
                     raise(visa.VisaIOError(-1073807343))
 
             # Use the resource selected
@@ -93,14 +292,25 @@ class Instrument():
             # Open resource
             self._inst = rm.open_resource(self._resource)
 
-        self._idn = self._inst.query('*IDN?')
+        self._idn = cached_idn(self._resource)
+        if self._idn is None:
+            self._idn = self._inst.query('*IDN?')
+            if not sim_mode:
+                _idns[self._resource] = (time.monotonic(), self._idn)
         self._name = self._idn.split(',')[0] + '-' + self._idn.split(',')[1]
 
         self._fullname = '{}/{}'.format(path, self._name)
         self._path = path
         self._path_data = path + '/data/temp.npy'
+        self._store = DataStore('{}/data/{}_{}_{}-{}.dat'.format(
+            path, self._name, time.strftime('%Y%m%d-%H%M%S'),
+            os.getpid(), next(_sessions)))
 
         self._log = LT('{}.log'.format(self._fullname))
+        self._state = None
+        self._policy = self._error_policy
+        self._unchecked = collections.deque(maxlen=MAX_UNCHECKED)
+        self._unchecked_count = 0
         self._temp_list = list()
 
         self._log.block(time.strftime('%x - %X'),
@@ -109,50 +319,211 @@ class Instrument():
                         self._name)
 
     def __del__(self):
+        self.close()
+
+    def close(self):
+        """ Log the end of the session and release the resource """
+        if getattr(self, '_inst', None) is None:
+            return
         self._log.block(time.strftime('%x - %X'),
                         'Session closed')
+        self._log.close()
+        self._store.close()
         self._inst.close()
-        
+        self._inst = None
+
+    def log_mode(self, buffered=None, flush_size=None, flush_interval=None,
+                 level=None, sampling=None):
+        """ Configure session log (see LogTools.configure) """
+        self._log.configure(buffered, flush_size, flush_interval,
+                            level, sampling)
+
+    def profile(self, enable=True, profiler=None):
+        """ Record per-command latency, returns the Profiler in use """
+        if isinstance(self._inst, ProfiledResource):
+            if enable and profiler is None:
+                return self._inst._profiler
+            self._inst = self._inst._resource
+        if enable:
+            self._inst = ProfiledResource(self._inst, profiler or Profiler())
+            return self._inst._profiler
+
+    def cache_state(self, enable=True):
+        """ Keep a write-through mirror of settings read by panels """
+        self._state = dict() if enable else None
+
+    def _cacheable(self, command, state):
+        """ False for queries whose answer is a measured value """
+        return True
+
+    def invalidate_state(self):
+        if self._state is not None:
+            self._state.clear()
+
     def is_illegal(self):
         return False
     
     def is_out_range(self):
         return False
 
-    def write(self, command, termination=None, encoding=None, log=True):
-        self._inst.write(command, termination, encoding)
+    def error_policy(self, policy='command'):
+        """
+        When errors are checked: 'command' after every command, an
+        integer N every N commands, or 'batch' only by check_errors and
+        at the end of deferred_errors blocks.
+        """
+        if not (policy in ('command', 'batch') or
+                (isinstance(policy, int) and policy > 0)):
+            raise ValueError('Invalid error policy {}'.format(policy))
+        self._policy = policy
+
+    def _read_errors(self):
+        """ Errors since the last check (one status read if possible) """
+        errors = list()
         if self.is_illegal():
-            raise ValueError('Illegal command is received')
+            errors.append('Illegal command is received')
         if self.is_out_range():
-            raise ValueError('Parameter is out of range')
+            errors.append('Parameter is out of range')
+        return errors
+
+    def check_errors(self):
+        """ Raise ValueError for errors of the commands since last check """
+        commands = list(self._unchecked)
+        count = self._unchecked_count
+        self._unchecked.clear()
+        self._unchecked_count = 0
+
+        errors = self._read_errors()
+        if not errors:
+            return
+        if count == 1:
+            source = commands[0]
+        else:
+            source = 'one of the last {} commands: {}'.format(
+                count, ' | '.join(commands))
+        raise ValueError('{} ({})'.format(', '.join(errors), source))
+
+    def _checked(self, command):
+        self._unchecked.append(command)
+        self._unchecked_count += 1
+        policy = self._policy
+        if policy == 'command' or (policy != 'batch' and
+                                   self._unchecked_count >= policy):
+            self.check_errors()
+
+    @contextlib.contextmanager
+    def deferred_errors(self):
+        """ Check errors only once, at the end of the block """
+        policy = self._policy
+        self._policy = 'batch'
+        try:
+            yield
+        finally:
+            self._policy = policy
+        self.check_errors()
+
+    def wait_until(self, ready, timeout=10.0, interval=0.001,
+                   max_interval=0.1):
+        """ Poll ready() with exponential backoff until it is true """
+        end = time.monotonic() + timeout
+        while not ready():
+            if time.monotonic() >= end:
+                raise TimeoutError('Not ready after {} s'.format(timeout))
+            time.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+    def write(self, command, termination=None, encoding=None, log=True):
+        self._inst.write(command, termination, encoding)
+        if self._state is not None and any(
+                unit.strip().split(' ')[0].upper() in self._volatile
+                for unit in command.split(';')):
+            self.invalidate_state()
+        self._checked(command)
         if log:
-            self._log.time_stamp(command)
+            self._log.time_stamp(command, level=LT.DEBUG)
 
     def query(self, command, delay=None, log=True):
         answer = self._inst.query(command, delay)
-        if self.is_illegal():
-            raise ValueError('Illegal command is received')
-        if self.is_out_range():
-            raise ValueError('Parameter is out of range')
+        self._checked(command)
         if log:
-            self._log.time_stamp(command, answer)
+            self._log.time_stamp(command, answer, level=LT.DEBUG)
         return answer
 
+    def _join_batch(self, commands, max_length=200):
+        message = list()
+        length = 0
+        for command in commands:
+            if message and length + len(command) + 1 > max_length:
+                yield message
+                message = list()
+                length = 0
+            message.append(command)
+            length += len(command) + 1
+        if message:
+            yield message
+
+    def write_batch(self, commands, separator=';', max_length=200,
+                    log=True):
+        """ Join commands in as few messages as possible """
+        messages = list(self._join_batch(commands, max_length))
+        for message in messages:
+            self.write(separator.join(message), log=log)
+        return len(messages)
+
+    def query_batch(self, commands, separator=';', max_length=200,
+                    log=True):
+        """ Join queries in as few messages as possible, split answers """
+        answers = list()
+        for message in self._join_batch(commands, max_length):
+            if self._joined_answers:
+                answer = self.query(separator.join(message), log=log)
+                answers += [a.strip() for a in
+                            answer.strip().split(separator)]
+            else:
+                answers += self._query_units(separator.join(message),
+                                             len(message), log)
+        if len(answers) != len(commands):
+            raise ValueError('Expected {} answers'.format(len(commands)))
+        return answers
+
+    def _query_units(self, message, count, log=True):
+        # One response, with its own terminator, per query in message
+        self._inst.write(message)
+        answers = [self._inst.read().strip() for i in range(count)]
+        self._checked(message)
+        if log:
+            self._log.time_stamp(message, ';'.join(answers),
+                                 level=LT.DEBUG)
+        return answers
+
+    @contextlib.contextmanager
+    def prefetch(self, commands):
+        """ Serve panel getters from one batched read of commands """
+        temporary = self._state is None
+        if temporary:
+            self._state = dict()
+        try:
+            missing = [c for c in commands if c not in self._state or
+                       not self._cacheable(c, self._state)]
+            if missing:
+                self._state.update(zip(missing, self.query_batch(missing)))
+            yield self._state
+        finally:
+            if temporary:
+                self._state = None
+
     def query_ascii_values(self, command, converter='f', separator=',',
                            container=list, delay=None, log=True):
         answer = self._inst.query_ascii_values(command, converter,
                                                separator, container,
                                                delay)
-        if self.is_illegal():
-            raise ValueError('Illegal command is received')
-        if self.is_out_range():
-            raise ValueError('Parameter is out of range')
+        self._checked(command)
         if log:
             if len(answer) < MAX_LOG_ANSWERS:
                 for value in answer:
-                    self._log.time_stamp(answer=value)
+                    self._log.time_stamp(answer=value, level=LT.DEBUG)
             else:
-                save = self.save(answer)
+                save = self.save(answer, command=command)
                 self._log.time_stamp(command, answer=save)
         return answer
 
@@ -163,31 +534,90 @@ class Instrument():
         answer = self._inst.query_binary_values(command, datatype,
                                                 is_big_endian, container,
                                                 delay, header_fmt)
-        if self.is_illegal():
-            raise ValueError('Illegal command is received')
-        if self.is_out_range():
-            raise ValueError('Parameter is out of range')
+        self._checked(command)
         if log:
-            save = self.save(answer)
+            save = self.save(answer, command=command)
             self._log.time_stamp(command, answer=save)
         return answer
 
-    def save(self, data, fullname='temp.npy'):
-        fullname = FT.newname(fullname, default=self._path_data)
-        np.save(fullname, data)
-        self._temp_list.append(fullname)
-        return fullname
+    def save(self, data, fullname='temp.npy', command=None, attrs=None):
+        """
+        Append data to the session store and return its reference.
+
+        A fullname with a directory is written there as a numbered .npy
+        file and its file name is returned. Only .npy is accepted.
+        """
+        path, name, extension = FT.splitname(fullname)
+        if extension not in ('', '.npy'):
+            raise ValueError('Data is saved as .npy, not {}'.format(
+                extension))
+        if path:
+            fullname = FT.newname(fullname, default=self._path_data)
+            np.save(fullname, data)
+            self._temp_list.append(fullname)
+            return fullname
+        name = self._store.append(data, name or 'temp', command, attrs)
+        reference = '{}:{}'.format(self._store.filename, name)
+        self._temp_list.append(reference)
+        return reference
+
+    def _reference(self, reference):
+        """ Store and record name of a 'file.dat:name' reference """
+        filename, _, name = reference.rpartition(':')
+        if not filename.endswith('.dat') or filename == self._store.filename:
+            return self._store, name
+        if not os.path.isfile(filename):
+            raise ValueError('Data file {} not found'.format(filename))
+        store = DataStore(filename)
+        if name not in store:
+            raise ValueError('No record {} in {}'.format(name, filename))
+        return store, name
 
     def load(self, fullname='temp.npy'):
+        """ Load data by store reference, record name or .npy file """
+        store, name = self._reference(fullname)
+        if name in store:
+            return store.read(name)
         fullname = FT.file_exist(fullname, default_path=self._path_data)
         return np.load(fullname)
 
 
 class CommandGroup(object):
 
+    # Queries read by _list_properties
+    _queries = ()
+
     def __init__(self, inst):
         self._inst = inst
 
+    def _query(self, command):
+        state = self._inst._state
+        if state is None:
+            return self._inst.query(command)
+        if command not in state or not self._inst._cacheable(command, state):
+            state[command] = self._inst.query(command)
+        return state[command]
+
+    def _query_values(self, command):
+        state = self._inst._state
+        if state is None:
+            return self._inst.query_ascii_values(command, separator=',')
+        if command not in state or not self._inst._cacheable(command, state):
+            state[command] = self._inst.query_ascii_values(command,
+                                                           separator=',')
+        elif isinstance(state[command], str):
+            # Raw answer from a batched read
+            state[command] = [float(v) for v in state[command].split(',')]
+        return state[command]
+
+    def _write(self, command, key=None, value=None, log=True):
+        self._inst.write(command, log=log)
+        if key is not None and self._inst._state is not None:
+            self._inst._state[key] = value
+
+    def _prefetched(self):
+        return self._inst.prefetch(self._queries)
+
     def _option_list(self, value, options, floats=None):
         error = 'Type option or number (0-{})'.format(len(options)-1)
         upper_options = [opt.upper() for opt in options]
@@ -233,4 +663,4 @@ class CommandGroup(object):
             raise ValueError(error)
 
     def _format_property(self, name, value, unit=''):
-        return '{:_<22.20} {:15} {:10}{}'.format(name + ':', value)
+        return '{:_<22.20} {:15} {}'.format(name + ':', value, unit)
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 
+import time
+
 from instruments import Instrument
 
 from lockin_commands import _lockin_autofuncs
@@ -12,12 +14,47 @@ from lockin_commands import _lockin_reference
 from lockin_commands import _lockin_setup
 from lockin_commands import _lockin_adquisition
 
+# VISA status codes of wait_for_srq that fall back to polling: timeout,
+# invalid event, operation or mechanism not supported by the backend
+_SRQ_STATUS = (-1073807339, -1073807322, -1073807257, -1073807312,
+               -1073807196)
+
+
+def _srq_errors():
+    """ Exceptions wait_for_srq raises when no service request comes """
+    errors = (NotImplementedError, TimeoutError)
+    try:
+        import visa
+    except ImportError:
+        return errors
+    return errors + (visa.VisaIOError,)
+
 
 class Lockin(Instrument):
     '''
     Class for PyVISA control of Lock-in Amplifier SR830.
     '''
 
+    # Commands that change settings other than their own
+    _volatile = ('*RST', '*RCL', 'AGAN', 'ARSV', 'APHS', 'AOFF', 'RSET')
+
+    # Each query of a message is answered separately
+    _joined_answers = False
+
+    # Errors are read with *ESR?, one status read every 10 commands
+    _error_policy = 10
+
+    # Panels are built on first access
+    _panel_classes = {'adquisition': _lockin_adquisition,
+                      'input_panel': _lockin_input,
+                      'ch1_panel': _lockin_ch1,
+                      'ch2_panel': _lockin_ch2,
+                      'auto_panel': _lockin_autofuncs,
+                      'setup_panel': _lockin_setup,
+                      'interface_panel': _lockin_interface,
+                      'reference_panel': _lockin_reference,
+                      'auxiliar_outs': _lockin_auxout}
+
     def __init__(self, resource=None, sim_mode=False, backend="@py",
                  query='GPIB?*::INSTR', name=None, path='./'):
 
@@ -26,18 +63,140 @@ class Lockin(Instrument):
         
         if not self._name == 'Stanford_Research_Systems-SR830':
             raise Warning('Using {}'.format(self._name))
-          
+
         self._inst.write('OUTX 1')
 
-        self.adquisition = _lockin_adquisition(self)
-        self.input_panel = _lockin_input(self)
-        self.ch1_panel = _lockin_ch1(self)
-        self.ch2_panel = _lockin_ch2(self)
-        self.auto_panel = _lockin_autofuncs(self)
-        self.setup_panel = _lockin_setup(self)
-        self.interface_panel = _lockin_interface(self)
-        self.reference_panel = _lockin_reference(self)
-        self.auxiliar_outs = _lockin_auxout(self)
-        
-    #def is_illegal(self):
-        
+    def __getattr__(self, name):
+        panel = self._panel_classes.get(name)
+        if panel is None:
+            raise AttributeError(
+                "'{}' object has no attribute '{}'".format(
+                    type(self).__name__, name))
+
+        setattr(self, name, panel(self))
+        return self.__dict__[name]
+
+    def __dir__(self):
+        return sorted(set(object.__dir__(self)) | set(self._panel_classes))
+
+    def _panels(self):
+        return (self.input_panel, self.reference_panel,
+                self.ch1_panel, self.ch2_panel,
+                self.auxiliar_outs, self.interface_panel)
+
+    def _panel_queries(self):
+        queries = list()
+        for panel in self._panels():
+            queries += panel._queries
+        return queries
+
+    def log_status(self):
+        """ Log every panel reading all settings in one or two messages """
+        with self.prefetch(self._panel_queries()):
+            for panel in self._panels():
+                panel._log()
+
+    def snapshot(self):
+        """ Return every panel setting as {query: [values]} """
+        state = dict()
+        queries = self._panel_queries()
+        with self.prefetch(queries) as current:
+            for query in queries:
+                value = current[query]
+                if isinstance(value, str):
+                    value = value.split(',')
+                elif not isinstance(value, (list, tuple)):
+                    value = [value]
+                state[query] = [float(v) for v in value]
+        return state
+
+    # Settings that are not restored by apply
+    _not_applied = ('LOCL?',)
+
+    def _apply_order(self, state, current):
+        """ Queries of state in a safe order for the reference settings """
+        fmod = float(state.get('FMOD?', current['FMOD?'])[0])
+        harm = float(state.get('HARM?', current['HARM?'])[0])
+
+        # harm * freq must stay within 102 kHz after every write
+        if harm * current['FREQ?'][0] <= 102000:
+            reference = ['FMOD?', 'HARM?', 'FREQ?']
+        else:
+            reference = ['FMOD?', 'FREQ?', 'HARM?']
+        if fmod == 0:
+            # External reference: the frequency is measured, not set
+            reference.remove('FREQ?')
+
+        order = [q for q in reference if q in state]
+        order += [q for q in state if q not in ('FMOD?', 'HARM?', 'FREQ?')
+                  and q not in self._not_applied]
+        return order
+
+    def apply(self, state, max_length=200):
+        """ Write only the settings of state that differ from current """
+        current = self.snapshot()
+        commands = list()
+        changes = dict()
+        for query in self._apply_order(state, current):
+            values = [float(v) for v in state[query]]
+            if current.get(query) == values:
+                continue
+            name, args = query.split('?')
+            args = args.strip()
+            text = ', '.join('{:.10g}'.format(v) for v in values)
+            if args:
+                text = args + ', ' + text
+            commands.append('{} {}'.format(name, text))
+            changes[query] = values if len(values) > 1 else values[0]
+
+        self.write_batch(commands, max_length=max_length)
+
+        if self._state is not None:
+            self._state.update(changes)
+
+        return commands
+
+    def _cacheable(self, command, state):
+        """ FREQ? is measured unless the reference is internal """
+        if command != 'FREQ?':
+            return True
+        fmod = state.get('FMOD?')
+        if isinstance(fmod, (list, tuple)):
+            fmod = fmod[0]
+        return fmod is not None and int(float(fmod)) == 1
+
+    def is_idle(self):
+        """ No command execution in progress (status byte bit 1) """
+        return bool(int(self._inst.query('*STB? 1')))
+
+    def run_complete(self, command, timeout=30.0):
+        """
+        Send command and return when the lock-in finishes it: on GPIB
+        waits a service request raised by *OPC, otherwise polls is_idle.
+        """
+        end = time.monotonic() + timeout
+        with self.deferred_errors():
+            if hasattr(self._inst, 'wait_for_srq'):
+                self.write('*ESE 1;*SRE 32', log=False)
+                self.write(command + ';*OPC')
+                try:
+                    self._inst.wait_for_srq(int(timeout * 1000))
+                    return
+                except _srq_errors() as error:
+                    # Event support depends on the VISA backend
+                    code = getattr(error, 'error_code', _SRQ_STATUS[0])
+                    if code not in _SRQ_STATUS:
+                        raise
+            else:
+                self.write(command)
+            self.wait_until(self.is_idle, max(end - time.monotonic(), 0))
+
+    def _read_errors(self):
+        """ Command and execution error bits of a single *ESR? read """
+        esr = int(self._inst.query('*ESR?'))
+        errors = list()
+        if esr & 32:
+            errors.append('Illegal command is received')
+        if esr & 16:
+            errors.append('Parameter is out of range')
+        return errors
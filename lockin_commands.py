@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import os
+import threading
 import time
 from instruments import CommandGroup
+from tools import MappedRows
 
 
 class _lockin_reference(CommandGroup):
 
+    _queries = ('FMOD?', 'FREQ?', 'PHAS?', 'SLVL?', 'HARM?', 'RSLP?')
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
@@ -14,54 +19,54 @@ class _lockin_reference(CommandGroup):
         self._crefRslp = ('Sine', 'TTL Rising', 'TTL Falling')
 
     def _get_refPhase(self):
-        return float(self._inst.query('PHAS?'))
+        return float(self._query('PHAS?'))
 
     def _set_refPhase(self, value):
         f = self._option_limited(value, vmin=-360.00, vmax=729.99, prec=2)
-        self._inst.write('PHAS {0:f}'.format(f))
+        self._write('PHAS {0:f}'.format(f), 'PHAS?', f)
 
     def _get_refMode(self):
-        return self._crefMode[int(self._inst.query('FMOD?'))]
+        return self._crefMode[int(self._query('FMOD?'))]
 
     def _set_refMode(self, value):
         i = self._option_list(value, self._crefMode)
-        self._inst.write('FMOD {0}'.format(i))
+        self._write('FMOD {0}'.format(i), 'FMOD?', i)
 
     def _get_refFreq(self):
-        return float(self._inst.query('FREQ?'))
+        return float(self._query('FREQ?'))
 
     def _set_refFreq(self, value):
         f = self._option_limited(value, vmin=0.001, vmax=102000, prec=3)
-        harm = int(self._inst.query('HARM?'))
+        harm = int(self._query('HARM?'))
         if harm * f > 102000:
             raise ValueError('harm * freq <= 102000Hz')
-        self._inst.write('FREQ {0:f}'.format(f))
+        self._write('FREQ {0:f}'.format(f), 'FREQ?', f)
 
     def _get_refAmpl(self):
-        return float(self._inst.query('SLVL?'))
+        return float(self._query('SLVL?'))
 
     def _set_refAmpl(self, value):
         f = self._option_limited(value, vmin=0.004, vmax=5.000, prec=3)
-        self._inst.write('SLVL {0:f}'.format(f))
+        self._write('SLVL {0:f}'.format(f), 'SLVL?', f)
 
     def _get_refHarm(self):
-        return int(self._inst.query('HARM?'))
+        return int(self._query('HARM?'))
 
     def _set_refHarm(self, value):
-        freq = float(self._inst.query('FREQ?'))
+        freq = float(self._query('FREQ?'))
         i = int(self._option_limited(value, vmin=1, vmax=19999, prec=0))
         try:
             self._option_limited(i * freq, vmin=0, vmax=102000.0, prec=4)
         except ValueError:
             raise ValueError('harm * freq <= 102000Hz')
-        self._inst.write('HARM {0}'.format(i))
+        self._write('HARM {0}'.format(i), 'HARM?', i)
 
     def _get_refRslp(self):
-        return self._crefRslp[int(self._inst.query('RSLP?'))]
+        return self._crefRslp[int(self._query('RSLP?'))]
 
     def _set_refRslp(self, value):
         i = self._option_list(value, self._crefRslp)
-        self._inst.write('RSLP {0}'.format(i))
+        self._write('RSLP {0}'.format(i), 'RSLP?', i)
 
     Phase = property(_get_refPhase, _set_refPhase)
     Source = property(_get_refMode, _set_refMode)
@@ -71,31 +76,35 @@ class _lockin_reference(CommandGroup):
     ExternalTrigger = property(_get_refRslp, _set_refRslp)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Source',
-                                           value=self.Mode))
-        lines.append(self._format_property(name='Frequency',
-                                           value=self.Frequency,
-                                           unit='Hz'))
-        lines.append(self._format_property(name='Phase',
-                                           value=self.Phase,
-                                           unit='º'))
-        lines.append(self._format_property(name='Amplitude',
-                                           value=self.Amplitude,
-                                           unit='Vrms'))
-        lines.append(self._format_property(name='Harmonic',
-                                           value=self.Harmonic))
-        lines.append(self._format_property(name='External Trigger',
-                                           value=self.ExternalTrigger))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Source',
+                                               value=self.Source))
+            lines.append(self._format_property(name='Frequency',
+                                               value=self.Frequency,
+                                               unit='Hz'))
+            lines.append(self._format_property(name='Phase',
+                                               value=self.Phase,
+                                               unit='º'))
+            lines.append(self._format_property(name='Amplitude',
+                                               value=self.Amplitude,
+                                               unit='Vrms'))
+            lines.append(self._format_property(name='Harmonic',
+                                               value=self.Harmonic))
+            lines.append(self._format_property(name='External Trigger',
+                                               value=self.ExternalTrigger))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Reference and Phase panel:')
-        self._inst._log.tabulated_lines(self._list_properties)
+        self._inst._log.tabulated_lines(self._list_properties())
 
 
 class _lockin_input(CommandGroup):
 
+    _queries = ('ISRC?', 'IGND?', 'ICPL?', 'ILIN?', 'SENS?',
+                'RMOD?', 'OFLT?', 'OFSL?', 'SYNC?')
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
@@ -140,67 +149,67 @@ class _lockin_input(CommandGroup):
                               1e3, 3e3, 10e3, 30e3)
 
     def _get_inpMode(self):
-        return self._cinpMode[int(self._inst.query('ISRC?'))]
+        return self._cinpMode[int(self._query('ISRC?'))]
 
     def _set_inpMode(self, value):
         i = self._option_list(value, self._cinpMode)
-        self._inst.write('ISRC {0}'.format(i))
+        self._write('ISRC {0}'.format(i), 'ISRC?', i)
 
     def _get_inpGnd(self):
-        return self._cinpGnd[int(self._inst.query('IGND?'))]
+        return self._cinpGnd[int(self._query('IGND?'))]
 
     def _set_inpGnd(self, value):
         i = self._option_list(value, self._cinpGnd)
-        self._inst.write('IGND {0}'.format(i))
+        self._write('IGND {0}'.format(i), 'IGND?', i)
 
     def _get_inpCoup(self):
-        return self._cinpCoup[int(self._inst.query('ICPL?'))]
+        return self._cinpCoup[int(self._query('ICPL?'))]
 
     def _set_inpCoup(self, value):
         i = self._option_list(value, self._cinpCoup)
-        self._inst.write('ICPL {0}'.format(i))
+        self._write('ICPL {0}'.format(i), 'ICPL?', i)
 
     def _get_inpLine(self):
-        return self._cinpLine[int(self._inst.query('ILIN?'))]
+        return self._cinpLine[int(self._query('ILIN?'))]
 
     def _set_inpLine(self, value):
         i = self._option_list(value, self._cinpLine)
-        self._inst.write('ILIN {0}'.format(i))
+        self._write('ILIN {0}'.format(i), 'ILIN?', i)
 
     def _get_inpSens(self):
-        return int(self._inst.query('SENS?'))
+        return int(self._query('SENS?'))
 
     def _set_inpSens(self, value):
         i = self._option_list(value, self._strinpSens, self._floatinpSens)
-        self._inst.write('SENS {0}'.format(i))
+        self._write('SENS {0}'.format(i), 'SENS?', i)
 
     def _get_inpRmod(self):
-        return self._cinpRmod[int(self._inst.query('RMOD?'))]
+        return self._cinpRmod[int(self._query('RMOD?'))]
 
     def _set_inpRmod(self, value):
         i = self._option_list(value, self._cinpRmod)
-        self._inst.write('RMOD {0}'.format(i))
+        self._write('RMOD {0}'.format(i), 'RMOD?', i)
 
     def _get_inpOflt(self):
-        return self._strinpOflt[int(self._inst.query('OFLT?'))]
+        return self._strinpOflt[int(self._query('OFLT?'))]
 
     def _set_inpOflt(self, value):
         i = self._option_list(value, self._strinpOflt, self._floatinpOflt)
-        self._inst.write('OFLT {0}'.format(i))
+        self._write('OFLT {0}'.format(i), 'OFLT?', i)
 
     def _get_inpOfsl(self):
-        return self._cinpOfsl[int(self._inst.query('OFSL?'))]
+        return self._cinpOfsl[int(self._query('OFSL?'))]
 
     def _set_inpOfsl(self, value):
         i = self._option_list(value, self._cinpOfsl)
-        self._inst.write('OFSL {0}'.format(i))
+        self._write('OFSL {0}'.format(i), 'OFSL?', i)
 
     def _get_inpSync(self):
-        return self._cinpSync[int(self._inst.query('SYNC?'))]
+        return self._cinpSync[int(self._query('SYNC?'))]
 
     def _set_inpSync(self, value):
         i = self._option_list(value, self._cinpSync)
-        self._inst.write('SYNC {0}'.format(i))
+        self._write('SYNC {0}'.format(i), 'SYNC?', i)
 
     Input = property(_get_inpMode, _set_inpMode)
     Ground = property(_get_inpGnd, _set_inpGnd)
@@ -214,64 +223,67 @@ class _lockin_input(CommandGroup):
     SyncFilter = property(_get_inpSync, _set_inpSync)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Source',
-                                           value=self.Input))
-        lines.append(self._format_property(name='Ground',
-                                           value=self.Ground))
-        lines.append(self._format_property(name='Coupling',
-                                           value=self.Couple))
-        lines.append(self._format_property(name='Notch',
-                                           value=self.Notch))
-        lines.append(self._format_property(name='Sensitivity',
-                                           value=self.Sensitivity))
-        lines.append(self._format_property(name='Reserve',
-                                           value=self.Reserve))
-        lines.append(self._format_property(name='Time Constant',
-                                           value=self.TimeConstant))
-        lines.append(self._format_property(name='Low Pass Filter',
-                                           value=self.LowPassFilter))
-        lines.append(self._format_property(name='Sync. Filter',
-                                           value=self.SyncFilter))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Source',
+                                               value=self.Input))
+            lines.append(self._format_property(name='Ground',
+                                               value=self.Ground))
+            lines.append(self._format_property(name='Coupling',
+                                               value=self.Couple))
+            lines.append(self._format_property(name='Notch',
+                                               value=self.Notch))
+            lines.append(self._format_property(name='Sensitivity',
+                                               value=self.Sensitivity))
+            lines.append(self._format_property(name='Reserve',
+                                               value=self.Reserve))
+            lines.append(self._format_property(name='Time Constant',
+                                               value=self.TimeConstant))
+            lines.append(self._format_property(name='Low Pass Filter',
+                                               value=self.LowPassFilter))
+            lines.append(self._format_property(name='Sync. Filter',
+                                               value=self.SyncFilter))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Input and Lock-in system panel:')
-        self._inst._log.tabulated_lines(self._list_properties)
+        self._inst._log.tabulated_lines(self._list_properties())
 
 
 class _lockin_auxout(CommandGroup):
 
+    _queries = ('AUXV? 1', 'AUXV? 2', 'AUXV? 3', 'AUXV? 4')
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
     def _get_auxout1(self):
-        return float(self._inst.query('AUXV? 1'))
+        return float(self._query('AUXV? 1'))
 
     def _set_auxout1(self, value):
         f = self._option_limited(value, vmin=-10.500, vmax=10.500, prec=3)
-        self._inst.write('AUXV 1, {0:f}'.format(f))
+        self._write('AUXV 1, {0:f}'.format(f), 'AUXV? 1', f)
 
     def _get_auxout2(self):
-        return float(self._inst.query('AUXV? 2'))
+        return float(self._query('AUXV? 2'))
 
     def _set_auxout2(self, value):
         f = self._option_limited(value, vmin=-10.500, vmax=10.500, prec=3)
-        self._inst.write('AUXV 2, {0:f}'.format(f))
+        self._write('AUXV 2, {0:f}'.format(f), 'AUXV? 2', f)
 
     def _get_auxout3(self):
-        return float(self._inst.query('AUXV? 3'))
+        return float(self._query('AUXV? 3'))
 
     def _set_auxout3(self, value):
         f = self._option_limited(value, vmin=-10.500, vmax=10.500, prec=3)
-        self._inst.write('AUXV 3, {0:f}'.format(f))
+        self._write('AUXV 3, {0:f}'.format(f), 'AUXV? 3', f)
 
     def _get_auxout4(self):
-        return float(self._inst.query('AUXV? 4'))
+        return float(self._query('AUXV? 4'))
 
     def _set_auxout4(self, value):
         f = self._option_limited(value, vmin=-10.500, vmax=10.500, prec=3)
-        self._inst.write('AUXV 4, {0:f}'.format(f))
+        self._write('AUXV 4, {0:f}'.format(f), 'AUXV? 4', f)
 
     AuxOut1 = property(_get_auxout1, _set_auxout1)
     AuxOut2 = property(_get_auxout2, _set_auxout2)
@@ -279,20 +291,21 @@ class _lockin_auxout(CommandGroup):
     AuxOut4 = property(_get_auxout4, _set_auxout4)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Auxiliar Output 1',
-                                           value=self.AuxOut1,
-                                           unit='V'))
-        lines.append(self._format_property(name='Auxiliar Output 2',
-                                           value=self.AuxOut2,
-                                           unit='V'))
-        lines.append(self._format_property(name='Auxiliar Output 3',
-                                           value=self.AuxOut3,
-                                           unit='V'))
-        lines.append(self._format_property(name='Auxiliar Output 4',
-                                           value=self.AuxOut4,
-                                           unit='V'))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Auxiliar Output 1',
+                                               value=self.AuxOut1,
+                                               unit='V'))
+            lines.append(self._format_property(name='Auxiliar Output 2',
+                                               value=self.AuxOut2,
+                                               unit='V'))
+            lines.append(self._format_property(name='Auxiliar Output 3',
+                                               value=self.AuxOut3,
+                                               unit='V'))
+            lines.append(self._format_property(name='Auxiliar Output 4',
+                                               value=self.AuxOut4,
+                                               unit='V'))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Auxiliar outputs:')
@@ -301,6 +314,8 @@ class _lockin_auxout(CommandGroup):
 
 class _lockin_ch1(CommandGroup):
 
+    _queries = ('DDEF? 1', 'FPOP? 1', 'OEXP? 1', 'OEXP? 2')
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
@@ -310,65 +325,71 @@ class _lockin_ch1(CommandGroup):
         self._cExpand = ('x1', 'x10', 'x100')
 
     def _get_ch1Mode(self):
-        d, r = self._inst.query_ascii_values('DDEF? 1', separator=',')
+        d, r = self._query_values('DDEF? 1')
         return self._cch1Mode[int(d)]
 
     def _set_ch1Mode(self, value):
-        d, r = self._inst.query_ascii_values('DDEF? 1', separator=',')
+        d, r = self._query_values('DDEF? 1')
         d = self._option_list(value, self._cch1Mode)
-        self._inst.write('DDEF 1, {d}, {r}'.format(d=d, r=r))
+        self._write('DDEF 1, {d}, {r}'.format(d=d, r=r),
+                    'DDEF? 1', [d, r])
 
     def _get_ch1RatS(self):
-        d, r = self._inst.query_ascii_values('DDEF? 1', separator=',')
-        return self._cch1Rats[int(r)]
+        d, r = self._query_values('DDEF? 1')
+        return self._cch1RatS[int(r)]
 
     def _set_ch1RatS(self, value):
-        d, r = self._inst.query_ascii_values('DDEF? 1', separator=',')
-        r = self._option_list(value, self._cch1Rats)
-        self._inst.write('DDEF 1, {d}, {r}'.format(d=d, r=r))
+        d, r = self._query_values('DDEF? 1')
+        r = self._option_list(value, self._cch1RatS)
+        self._write('DDEF 1, {d}, {r}'.format(d=d, r=r),
+                    'DDEF? 1', [d, r])
 
     def _get_ch1OutS(self):
-        return self._cch1OutS[int(self._inst.query('FPOP? 1'))]
+        return self._cch1OutS[int(self._query('FPOP? 1'))]
 
     def _set_ch1OutS(self, value):
         i = self._option_list(value, self._cch1OutS)
-        self._inst.write('FPOP 1, {}'.format(i))
+        self._write('FPOP 1, {}'.format(i), 'FPOP? 1', i)
 
     def _get_offsetX(self):
-        x, j = self._inst.query_ascii_values('OEXP? 1', separator=',')
+        x, j = self._query_values('OEXP? 1')
         return x
 
     def _set_offsetX(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 1', separator=',')
+        x, j = self._query_values('OEXP? 1')
         x = self._option_limited(value, vmin=-105.00, vmax=105.00, prec=2)
-        self._inst.write('OEXP 1, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 1, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 1', [x, j])
 
     def _get_offsetY(self):
-        x, j = self._inst.query_ascii_values('OEXP? 2', separator=',')
+        x, j = self._query_values('OEXP? 2')
         return x
 
     def _set_offsetY(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 2', separator=',')
+        x, j = self._query_values('OEXP? 2')
         x = self._option_limited(value, vmin=-105.00, vmax=105.00, prec=2)
-        self._inst.write('OEXP 2, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 2, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 2', [x, j])
 
     def _get_expandX(self):
-        x, j = self._inst.query_ascii_values('OEXP? 1', separator=',')
-        return self._cExpand[j]
+        x, j = self._query_values('OEXP? 1')
+        return self._cExpand[int(j)]
 
     def _set_expandX(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 1', separator=',')
+        x, j = self._query_values('OEXP? 1')
         j = self._option_list(value, self._cExpand)
-        self._inst.write('OEXP 1, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 1, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 1', [x, j])
 
     def _get_expandY(self):
-        x, j = self._inst.query_ascii_values('OEXP? 2', separator=',')
-        return self._cExpand[j]
+        x, j = self._query_values('OEXP? 2')
+        return self._cExpand[int(j)]
 
     def _set_expandY(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 2', separator=',')
+        x, j = self._query_values('OEXP? 2')
         j = self._option_list(value, self._cExpand)
-        self._inst.write('OEXP 2, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 2, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 2', [x, j])
 
     Display = property(_get_ch1Mode, _set_ch1Mode)
     Ratio = property(_get_ch1RatS, _set_ch1RatS)
@@ -379,34 +400,37 @@ class _lockin_ch1(CommandGroup):
     ExpandY = property(_get_expandY, _set_expandY)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Source',
-                                           value=self.Display))
-        lines.append(self._format_property(name='Ratio',
-                                           value=self.Ratio))
-        lines.append(self._format_property(name='Output',
-                                           value=self.Output))
-        lines.append(self._format_property(name='Offset X',
-                                           value=self.OffsetX,
-                                           unit='%'))
-        lines.append(self._format_property(name='Offset Y',
-                                           value=self.OffsetY,
-                                           unit='%'))
-        lines.append(self._format_property(name='Expand X',
-                                           value=self.ExpandX,
-                                           unit='%'))
-        lines.append(self._format_property(name='Expand Y',
-                                           value=self.ExpandX,
-                                           unit='%'))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Source',
+                                               value=self.Display))
+            lines.append(self._format_property(name='Ratio',
+                                               value=self.Ratio))
+            lines.append(self._format_property(name='Output',
+                                               value=self.Output))
+            lines.append(self._format_property(name='Offset X',
+                                               value=self.OffsetX,
+                                               unit='%'))
+            lines.append(self._format_property(name='Offset Y',
+                                               value=self.OffsetY,
+                                               unit='%'))
+            lines.append(self._format_property(name='Expand X',
+                                               value=self.ExpandX,
+                                               unit='%'))
+            lines.append(self._format_property(name='Expand Y',
+                                               value=self.ExpandY,
+                                               unit='%'))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Channel 1 panel:')
-        self._inst._log.tabulated_lines(self._list_properties)
+        self._inst._log.tabulated_lines(self._list_properties())
 
 
 class _lockin_ch2(CommandGroup):
 
+    _queries = ('DDEF? 2', 'FPOP? 2', 'OEXP? 3')
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
@@ -416,47 +440,51 @@ class _lockin_ch2(CommandGroup):
         self._cExpand = ('x1', 'x10', 'x100')
 
     def _get_ch2Mode(self):
-        d, r = self._inst.query_ascii_values('DDEF? 2', separator=',')
-        return self._cch2Mode[d]
+        d, r = self._query_values('DDEF? 2')
+        return self._cch2Mode[int(d)]
 
     def _set_ch2Mode(self, value):
-        d, r = self._inst.query_ascii_values('DDEF? 2', separator=',')
-        d = self._option_list(value, self._cch1Mode)
-        self._inst.write('DDEF 1, {d}, {r}'.format(d=d, r=r))
+        d, r = self._query_values('DDEF? 2')
+        d = self._option_list(value, self._cch2Mode)
+        self._write('DDEF 2, {d}, {r}'.format(d=d, r=r),
+                    'DDEF? 2', [d, r])
 
     def _get_ch2RatS(self):
-        d, r = self._inst.query_ascii_values('DDEF? 2', separator=',')
-        return self._cch2Rats[r]
+        d, r = self._query_values('DDEF? 2')
+        return self._cch2RatS[int(r)]
 
     def _set_ch2RatS(self, value):
-        d, r = self._inst.query_ascii_values('DDEF? 2', separator=',')
-        r = self._option_list(value, self._cch1Rats)
-        self._inst.write('DDEF 1, {d}, {r}'.format(d=d, r=r))
+        d, r = self._query_values('DDEF? 2')
+        r = self._option_list(value, self._cch2RatS)
+        self._write('DDEF 2, {d}, {r}'.format(d=d, r=r),
+                    'DDEF? 2', [d, r])
 
     def _get_ch2OutS(self):
-        return self._cch2OutS[int(self._inst.query('FPOP? 2'))]
+        return self._cch2OutS[int(self._query('FPOP? 2'))]
 
     def _set_ch2OutS(self, value):
         i = self._option_list(value, self._cch2OutS)
-        self._inst.write('FPOP 2, {}'.format(i))
+        self._write('FPOP 2, {}'.format(i), 'FPOP? 2', i)
 
     def _get_offsetR(self):
-        x, j = self._inst.query_ascii_values('OEXP? 3', separator=',')
+        x, j = self._query_values('OEXP? 3')
         return x
 
     def _set_offsetR(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 3', separator=',')
+        x, j = self._query_values('OEXP? 3')
         x = self._option_limited(value, vmin=-105.00, vmax=105.00, prec=2)
-        self._inst.write('OEXP 3, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 3, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 3', [x, j])
 
     def _get_expandR(self):
-        x, j = self._inst.query_ascii_values('OEXP? 3', separator=',')
-        return self._cExpand[j]
+        x, j = self._query_values('OEXP? 3')
+        return self._cExpand[int(j)]
 
     def _set_expandR(self, value):
-        x, j = self._inst.query_ascii_values('OEXP? 3', separator=',')
+        x, j = self._query_values('OEXP? 3')
         j = self._option_list(value, self._cExpand)
-        self._inst.write('OEXP 3, {x}, {j}'.format(x=x, j=j))
+        self._write('OEXP 3, {x}, {j}'.format(x=x, j=j),
+                    'OEXP? 3', [x, j])
 
     Display = property(_get_ch2Mode, _set_ch2Mode)
     Ratio = property(_get_ch2RatS, _set_ch2RatS)
@@ -465,51 +493,55 @@ class _lockin_ch2(CommandGroup):
     ExpandR = property(_get_expandR, _set_expandR)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Source',
-                                           value=self.Display))
-        lines.append(self._format_property(name='Ratio',
-                                           value=self.Ratio))
-        lines.append(self._format_property(name='Output',
-                                           value=self.Output))
-        lines.append(self._format_property(name='Offset R',
-                                           value=self.OffsetX,
-                                           unit='%'))
-        lines.append(self._format_property(name='Expand R',
-                                           value=self.ExpandX,
-                                           unit='%'))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Source',
+                                               value=self.Display))
+            lines.append(self._format_property(name='Ratio',
+                                               value=self.Ratio))
+            lines.append(self._format_property(name='Output',
+                                               value=self.Output))
+            lines.append(self._format_property(name='Offset R',
+                                               value=self.OffsetR,
+                                               unit='%'))
+            lines.append(self._format_property(name='Expand R',
+                                               value=self.ExpandR,
+                                               unit='%'))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Channel 2 panel:')
-        self._inst._log.tabulated_lines(self._list_properties)
+        self._inst._log.tabulated_lines(self._list_properties())
 
 
 class _lockin_interface(CommandGroup):
 
+    _queries = ('LOCL?',)
+
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
         self._cstpLock = ('Local', 'Remote', 'Local Lockout')
 
     def _get_stpLock(self):
-        return self._cstpLock[int(self._inst.query('LOCL?'))]
+        return self._cstpLock[int(self._query('LOCL?'))]
 
     def _set_stpLock(self, value):
         i = self._option_list(value, self._cstpLock)
-        self._inst.write('LOCL{0}'.format(i))
+        self._write('LOCL {0}'.format(i), 'LOCL?', i)
 
     Lock = property(_get_stpLock, _set_stpLock)
 
     def _list_properties(self):
-        lines = list()
-        lines.append(self._format_property(name='Local / Remote',
-                                           value=self.Lock))
-        return lines
+        with self._prefetched():
+            lines = list()
+            lines.append(self._format_property(name='Local / Remote',
+                                               value=self.Lock))
+            return lines
 
     def _log(self):
         self._inst._log.underline('Interface panel:')
-        self._inst._log.tabulated_lines(self._list_properties)
+        self._inst._log.tabulated_lines(self._list_properties())
 
 
 class _lockin_autofuncs(CommandGroup):
@@ -517,36 +549,30 @@ class _lockin_autofuncs(CommandGroup):
     def __init__(self, inst):
         CommandGroup.__init__(self, inst)
 
-    def autoGain(self):
+    def autoGain(self, timeout=30.0):
         """ Run autoGain function """
-        self._inst.write('AGAN')
         print('Running autoGain... ', end='')
-        while not bool(self._inst.query('*STB?1')):
-            pass
+        self._inst.run_complete('AGAN', timeout)
         print('Finalizado')
 
-    def autoReserve(self):
+    def autoReserve(self, timeout=30.0):
         """ Run autoReserve function """
-        self._inst.write('ARSV')
         print('Running autoReserve... ', end='')
-        while not bool(self._inst.query('*STB?1')):
-            pass
+        self._inst.run_complete('ARSV', timeout)
         print('Finalizado')
 
-    def autoPhase(self):
+    def autoPhase(self, timeout=30.0):
         """ Run autoPhase function """
-        self._inst.write('APHS')
         print('Running autoPhase... ', end='')
-        time.sleep(2)
+        self._inst.run_complete('APHS', timeout)
         print('Finalizado')
 
-    def autoOffset(self, num):
+    def autoOffset(self, num, timeout=30.0):
         """ Run autoOffset function """
         if not (num == 1 or num == 2 or num == 3):
             raise ValueError('X(1), Y(2), R(3)')
-        self._inst.write('AOFF {0}'.format(num))
         print('Running autoOffset... ', end='')
-        time.sleep(2)
+        self._inst.run_complete('AOFF {0}'.format(num), timeout)
         print('Finalizado')
 
 
@@ -570,6 +596,132 @@ class _lockin_setup(CommandGroup):
         print('Setup loaded from slot {0}'.format(slot))
 
 
+class MeasurementPlan(object):
+    '''
+    SNAP? of fixed parameters prepared once for high rate polling.
+
+    The message is encoded when the plan is created and each answer is
+    parsed straight into a NumPy row: no option checks, no lists and no
+    session log per read. Errors follow the error policy of the lock-in.
+    '''
+
+    def __init__(self, inst, params, command):
+        self._inst = inst
+        self.params = tuple(params)
+        self.command = command
+        termination = getattr(inst._inst, 'write_termination', None)
+        self._message = (command + (termination or '\n')).encode()
+        self._rows = np.zeros([1, len(params)], dtype=float)
+        self.row = self._rows[0]
+
+    def read_into(self, array, i):
+        """ Read one sample into array[i] """
+        resource = self._inst._inst
+        resource.write_raw(self._message)
+        array[i] = resource.read_raw().split(b',')
+        self._inst._checked(self.command)
+
+    def read(self):
+        """ Read one sample, returns the plan row (overwritten next read) """
+        self.read_into(self._rows, 0)
+        return self.row
+
+
+class Recorder(object):
+    '''
+    Background SNAP? recording into a growable memory-mapped .npy file.
+
+    Each row is (monotonic time, values...) with the time taken at the
+    middle of the read. Only one chunk of rows is mapped at a time, so
+    memory does not grow with the length of the run. The lock-in should
+    not be used from other threads while recording.
+    '''
+
+    def __init__(self, plan, fullname, interval=0.0, chunk=4096):
+        self._plan = plan
+        self._inst = plan._inst
+        self.interval = interval
+        self._rows = MappedRows(fullname, len(plan.params) + 1,
+                                chunk=chunk)
+        self._thread = None
+        self._stop = threading.Event()
+        self._error = None
+
+    @property
+    def filename(self):
+        return self._rows.filename
+
+    @property
+    def columns(self):
+        return ('time',) + self._plan.params
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def start(self):
+        if self.running:
+            raise ValueError('Recorder already running')
+        if self._rows.closed:
+            raise ValueError('Recorder stopped, {} is closed: use a new '
+                             'recorder'.format(self.filename))
+        self._stop.clear()
+        self._error = None
+        self._thread = threading.Thread(target=self._record, daemon=True)
+        self._thread.start()
+        return self
+
+    def _record(self):
+        plan = self._plan
+        rows = self._rows
+        values = slice(1, None)
+        deadline = time.monotonic()
+        try:
+            with self._inst.deferred_errors():
+                while not self._stop.is_set():
+                    row = rows.next_row()
+                    start = time.monotonic()
+                    plan.read_into(row, values)
+                    row[0] = (start + time.monotonic()) / 2
+                    rows.commit()
+                    if self.interval > 0:
+                        deadline += self.interval
+                        self._stop.wait(max(deadline - time.monotonic(),
+                                            0))
+        except Exception as error:
+            self._error = error
+
+    def stop(self):
+        """ Stop recording, log the file and close it """
+        if self._rows.closed:
+            return len(self._rows)
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self._rows.close()
+
+        command = '{} x{}'.format(self._plan.command, len(self._rows))
+        self._inst._log.time_stamp(command, answer=self.filename)
+        if self._error is not None:
+            raise self._error
+        return len(self._rows)
+
+    def snapshot(self, start=0, stop=None):
+        """ Read-only (rows, columns) view of the samples recorded so far """
+        self._rows.flush()
+        return self._rows.view(start, stop)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
 class _lockin_adquisition(CommandGroup):
 
     def __init__(self, inst):
@@ -594,32 +746,107 @@ class _lockin_adquisition(CommandGroup):
         else:
             raise ValueError('CH1=1, CH2=2')
 
-    def read_multiple(self, *args, log=True):
-        options = {'X': 1, 'Y': 2, 'R': 3, 'T': 4,
-                   'AuxIn1': 5, 'AuxIn2': 6, 'AuxIn3': 7, 'AuxIn4': 8,
-                   'Freq': 9, 'Ch1': 10, 'Ch2': 11}
-
-        if 2 <= len(args) <= 6:
-            command = 'SNAP? '
-            for param in args:
-                if param in options:
-                    command += str(options[param]) + ', '
-                else:
-                    raise ValueError(options.keys())
-            command = command[0:-2]
-        else:
+    # Parameters of SNAP?
+    _snap = {'X': 1, 'Y': 2, 'R': 3, 'T': 4,
+             'AuxIn1': 5, 'AuxIn2': 6, 'AuxIn3': 7, 'AuxIn4': 8,
+             'Freq': 9, 'Ch1': 10, 'Ch2': 11}
+
+    def _snap_command(self, params):
+        if not 2 <= len(params) <= 6:
             raise ValueError('Expected 2 to 6 args')
+        for param in params:
+            if param not in self._snap:
+                raise ValueError(self._snap.keys())
+        return 'SNAP? ' + ', '.join(str(self._snap[p]) for p in params)
 
+    def read_multiple(self, *args, log=True):
+        command = self._snap_command(args)
         return self._inst.query_ascii_values(command, separator=",", log=log)
 
+    def plan(self, *params):
+        """ MeasurementPlan for repeated reads of SNAP? params """
+        return MeasurementPlan(self._inst, params,
+                               self._snap_command(params))
+
     def read_auxiliar(self, aux=1):
         if aux in [1, 2, 3, 4]:
             return float(self._inst.query('OAUX? {0}'.format(aux)))
         else:
             raise ValueError('Auxiliar inputs: 1 to 4')
 
+    # Time constants to settle within 99% for 6, 12, 18 and 24 dB/oct
+    _settling = (4.6, 6.6, 8.4, 10.0)
+
+    # Full scale of SNAP? params not measured with the sensitivity
+    # (0 compares Freq relative to its value)
+    _full_scale = {'T': 180.0, 'AuxIn1': 10.5, 'AuxIn2': 10.5,
+                   'AuxIn3': 10.5, 'AuxIn4': 10.5, 'Freq': 0.0}
+
+    def time_constant(self):
+        return self._inst.input_panel._floatinpOflt[int(self._query('OFLT?'))]
+
+    def settle_time(self):
+        """ Wait needed after a step change with current filter """
+        return (self.time_constant() *
+                self._settling[int(self._query('OFSL?'))])
+
+    # Full scale of each Ch1/Ch2 display (DDEF? n), None the sensitivity
+    _display_scale = {'Ch1': (None, None, None, 10.5, 10.5),
+                      'Ch2': (None, 180.0, None, 10.5, 10.5)}
+
+    def full_scale(self, *params):
+        """ Full scale of each param, the sensitivity for X, Y, R """
+        scale = list()
+        sens = None
+        for param in params:
+            if param in self._full_scale:
+                scale.append(self._full_scale[param])
+                continue
+            if param in self._display_scale:
+                d, r = self._query_values('DDEF? {}'.format(param[-1]))
+                display = self._display_scale[param][int(d)]
+                if display is not None:
+                    scale.append(display)
+                    continue
+            if sens is None:
+                sens = self._inst.input_panel._floatinpSens[
+                    int(self._query('SENS?'))]
+            scale.append(sens)
+        return np.asarray(scale)
+
+    def settled_read(self, *params, delay='auto', tolerance=None,
+                     interval=None, max_polls=10, full_scale=None, log=True):
+        """
+        Wait delay (or settle_time) and, with tolerance, read every
+        interval (a time constant) until no param changes more than
+        tolerance times its full scale.
+        """
+        if delay == 'auto':
+            delay = self.settle_time()
+        if tolerance is not None:
+            if interval is None:
+                interval = self.time_constant()
+            if full_scale is None:
+                full_scale = self.full_scale(*params)
+
+        time.sleep(delay)
+        values = np.asarray(self.read_multiple(*params, log=log))
+
+        if tolerance is not None:
+            for i in range(max_polls):
+                time.sleep(interval)
+                last = values
+                values = np.asarray(self.read_multiple(*params, log=log))
+                bound = tolerance * np.where(full_scale > 0, full_scale,
+                                             np.abs(last))
+                if np.all(np.abs(values - last) <= bound):
+                    break
+
+        return values
+
     def sweep_freq(self, start, end, step=None, n=200, delay=0,
-                   params=['X', 'Y', 'R', 'T'], log=True):
+                   params=['X', 'Y', 'R', 'T'], tolerance=None,
+                   log=True):
 
         if step is None:
             step = (end - start) / n
@@ -627,7 +854,7 @@ class _lockin_adquisition(CommandGroup):
             if step == 0:
                 raise ValueError('Expected step != 0')
             step = abs(step) * np.sign(end - start)
-            n = (end - start) / step
+            n = int((end - start) / step)
 
         self._option_limited(start, vmin=0.001, vmax=102000, prec=3)
         self._option_limited(end, vmin=0.001, vmax=102000, prec=3)
@@ -638,34 +865,132 @@ class _lockin_adquisition(CommandGroup):
             raise
 
         freqs = start + np.arange(n, dtype=float) * step
-        reads = np.zeros([n, len(params)], dtype=float)
 
-        for i, f in enumerate(freqs):
-            self._inst.write('FREQ {0:f}'.format(f), log=False)
-            reads[i] = self.read_multiple(*params, log=False)
-            time.sleep(delay)
+        interval = None
+        full_scale = None
+        if delay == 'auto':
+            delay = self.settle_time()
+        if tolerance is not None:
+            interval = self.time_constant()
+            full_scale = self.full_scale(*params)
+
+        reads = self._sweep_points(freqs, params, delay, tolerance, interval,
+                                   full_scale)
 
         if log:
-            save = self._inst.save([freqs, reads.T])
+            command = 'Sweep Frequency {:f} to {:f}Hz '.format(start, end)
+            command += 'with step {:f}Hz'.format(step)
+            self._log_sweep(command, params, freqs, reads)
 
-            command = 'Sweep Frequency {.f} to {.f}Hz '.format(start, end)
-            command += 'with step {.f}Hz'.format(step)
-            answer = 'Freq, ('
-            for param in params:
-                answer += str(param) + ', '
-            command = command[0:-2] + ') -> '
+        return freqs, reads.T
 
-            self._log.time_stamp(command, answer + save)
+    def sweep_freq_adaptive(self, start, end, n=21, max_points=200,
+                            refine=0.05, min_step=None, delay=0,
+                            params=['X', 'Y', 'R', 'T'], tolerance=None,
+                            log=True):
+        """ Coarse sweep refined where the readings change fastest """
+
+        self._option_limited(start, vmin=0.001, vmax=102000, prec=3)
+        self._option_limited(end, vmin=0.001, vmax=102000, prec=3)
+
+        if not 2 <= n <= max_points:
+            raise ValueError('Expected 2 <= n <= max_points')
+
+        if min_step is None:
+            min_step = abs(end - start) / (max_points * 10)
+
+        self.read_multiple(*params, log=False)
+
+        interval = None
+        full_scale = None
+        if delay == 'auto':
+            delay = self.settle_time()
+        if tolerance is not None:
+            interval = self.time_constant()
+            full_scale = self.full_scale(*params)
+
+        freqs = np.linspace(start, end, n)
+        reads = self._sweep_points(freqs, params, delay, tolerance, interval,
+                                   full_scale)
+
+        while len(freqs) < max_points:
+            order = np.argsort(freqs)
+            freqs, reads = freqs[order], reads[order]
+
+            # Largest change of any parameter relative to its span,
+            # with the phase unwrapped so the +-180 deg jump is ignored
+            values = reads.copy()
+            for j, param in enumerate(params):
+                if param == 'T':
+                    values[:, j] = np.rad2deg(np.unwrap(
+                        np.deg2rad(values[:, j])))
+            span = np.ptp(values, axis=0)
+            span[span == 0] = 1
+            score = np.max(np.abs(np.diff(values, axis=0)) / span, axis=1)
+            score[np.diff(freqs) < 2 * min_step] = 0
+
+            candidates = np.argsort(score)[::-1]
+            candidates = candidates[score[candidates] > refine]
+            candidates = candidates[:max_points - len(freqs)]
+            if len(candidates) == 0:
+                break
+
+            new_freqs = (freqs[candidates] + freqs[candidates + 1]) / 2
+            freqs = np.concatenate([freqs, new_freqs])
+            reads = np.concatenate([reads, self._sweep_points(
+                new_freqs, params, delay, tolerance, interval,
+                full_scale)])
+
+        order = np.argsort(freqs)
+        freqs, reads = freqs[order], reads[order]
+
+        if log:
+            command = 'Adaptive Sweep Frequency {:f} to {:f}Hz '.format(
+                start, end)
+            command += 'with {} points'.format(len(freqs))
+            self._log_sweep(command, params, freqs, reads)
 
         return freqs, reads.T
 
+    def _sweep_points(self, freqs, params, delay=0, tolerance=None,
+                      interval=None, full_scale=None):
+        reads = np.zeros([len(freqs), len(params)], dtype=float)
+        with self._inst.deferred_errors():
+            for i, f in enumerate(freqs):
+                self._write('FREQ {0:f}'.format(f), 'FREQ?', f, log=False)
+                reads[i] = self.settled_read(*params, delay=delay,
+                                             tolerance=tolerance,
+                                             interval=interval,
+                                             full_scale=full_scale,
+                                             log=False)
+        return reads
+
+    def _log_sweep(self, command, params, freqs, reads):
+        save = self._inst.save(np.vstack([freqs, reads.T]),
+                               'sweep_freq', command=command)
+
+        answer = 'Freq, ('
+        for param in params:
+            answer += str(param) + ', '
+        answer = answer[0:-2] + ') -> '
+
+        self._inst._log.time_stamp(command, answer + save)
+
+    def recorder(self, *params, fullname=None, interval=0.0, chunk=4096):
+        """ Recorder of SNAP? params, every interval seconds or at once """
+        if fullname is None:
+            # Next to the session store, numbered within the session
+            self._records = getattr(self, '_records', 0) + 1
+            fullname = '{}_record{}.npy'.format(
+                os.path.splitext(self._inst._store.filename)[0],
+                self._records)
+        return Recorder(self.plan(*params), fullname, interval, chunk)
+
     @property
     def buffer_stored(self):
         return int(self._inst.query('SPTS?', log=False))
 
-    def buffer_one_shoot(self, sample_rate='64 Hz', points=16383,
-                         wait=True):
-    
+    def _buffer_start(self, sample_rate='64 Hz', loop=False):
         strFreqs = ('62.5 mHz', '125 mHz', '250 mHz', '500 mHz', '1 Hz',
                     '2 Hz', '4 Hz', '8 Hz', '16 Hz', '32 Hz',
                     '64 Hz', '128 Hz', '256 Hz', '512 Hz')
@@ -676,28 +1001,37 @@ class _lockin_adquisition(CommandGroup):
 
         i = self._option_list(sample_rate, strFreqs, floatFreqs)
 
-        if not (1 <= points <= 16383):
-            raise ValueError('Points out of range (1 to 16383)')
-
         self._inst.write('SRAT {}'.format(i), log=False)
-        self._inst.write('SEND 0', log=False)
+        self._inst.write('SEND {}'.format(int(loop)), log=False)
         print('Buffer reset', end='')
         self._inst.write('REST', log=False)
         print('. Done')
         self._inst.write('STRT', log=False)
         print('Buffer storage in progress')
 
+        return floatFreqs[i]
+
+    def buffer_one_shoot(self, sample_rate='64 Hz', points=16383,
+                         wait=True):
+
+        if not (1 <= points <= 16383):
+            raise ValueError('Points out of range (1 to 16383)')
+
+        self._buffer_start(sample_rate, loop=False)
+
         pr = self.buffer_stored
 
         if wait:
-            while pr < points:
-                pr = self.buffer_stored
-                msg = '\rRemaining: {:5d}/{:5d}'.format(pr, points)
-                print(msg, end='\r')
-                time.sleep(0.1)
+            with self._inst.deferred_errors():
+                while pr < points:
+                    pr = self.buffer_stored
+                    msg = '\rRemaining: {:5d}/{:5d}'.format(pr, points)
+                    print(msg, end='\r')
+                    time.sleep(0.1)
             print(msg + '. Done')
 
-    def buffer_read(self, display=1, start=0, end=16383):
+    def buffer_read(self, display=1, start=0, end=16383, mode='binary'):
+        """ Read points from buffer (mode: 'binary', 'compact' or 'ascii') """
 
         if not (1 <= end <= 16383) or start > end:
             raise ValueError('Points out of range (0 to 16383)')
@@ -708,11 +1042,98 @@ class _lockin_adquisition(CommandGroup):
         if self._inst.query('SEND?', log=False) == 1:
             self._inst.write('PAUS', log=False)
 
-        command = 'TRCA? {}, {}, {}'.format(display, start, end)
+        return self._buffer_transfer(display, start, end, mode)
+
+    def buffer_stream(self, display=1, sample_rate='64 Hz', points=16383,
+                      chunk=64, mode='binary', loop=False):
+        """
+        Start storage and yield new buffer points as they arrive.
+
+        With loop the storage never stops: once the buffer is full each
+        chunk is read again if a new point shifted the bins during its
+        transfer, so no point is lost or repeated.
+        """
+
+        if points < 1 or (not loop and points > 16383):
+            raise ValueError('Points out of range (1 to 16383)')
 
+        if chunk < 1:
+            raise ValueError('Expected chunk >= 1')
+
+        rate = self._buffer_start(sample_rate, loop=loop)
+        chunk = min(chunk, points)
+        delay = chunk / rate
+        done = 0
+
+        try:
+            while done < points:
+                stored = self.buffer_stored
+                new = min(stored - done, points - done)
+
+                # Wait until a full chunk (or the last points) is available
+                if new < chunk and done + new < points:
+                    time.sleep(max(delay * (chunk - new) / chunk, 0.01))
+                    continue
+
+                # Once the loop buffer is full bins shift with every new
+                # point: count again after the transfer and read again if
+                # the bins moved meanwhile
+                for attempt in range(self._stream_retries):
+                    start = self._buffer_bin(stored, done)
+                    data = self._buffer_transfer(display, start, new, mode)
+                    if not loop or stored + chunk <= 16383:
+                        break
+                    stored = self.buffer_stored
+                    if self._buffer_bin(stored, done) == start:
+                        break
+                else:
+                    raise RuntimeError('Buffer shifted during every '
+                                       'transfer: lower the sample rate '
+                                       'or the chunk')
+                yield data
+                done += new
+        finally:
+            self._inst.write('PAUS', log=False)
+
+    # Transfers of a chunk tried while the loop buffer keeps shifting
+    _stream_retries = 10
+
+    def _buffer_bin(self, stored, done):
+        """ Bin of point number done with stored points in the buffer """
+        if stored <= 16383:
+            return done
+        # Loop mode: bin 0 is always the oldest point
+        if stored - done > 16383:
+            raise RuntimeError('Buffer overrun: read slower than sample '
+                               'rate')
+        return 16383 - (stored - done)
+
+    def _buffer_transfer(self, display=1, start=0, count=16383,
+                         mode='binary'):
+        modes = {'ascii': 'TRCA?', 'binary': 'TRCB?', 'compact': 'TRCL?'}
+        if mode not in modes:
+            raise ValueError(tuple(modes.keys()))
+
+        command = '{} {}, {}, {}'.format(modes[mode], display, start, count)
         self._inst._inst.write(command)
-        data_raw = self._inst._inst.read_raw()
-        data = data_raw.decode()[0:-1]
-        data = data.split(',')
 
-        return np.asarray(data, dtype=float)
+        if mode == 'ascii':
+            data_raw = self._inst._inst.read_raw()
+            data = data_raw.decode().strip().strip(',')
+            data = data.split(',')
+            return np.asarray(data, dtype=float)
+
+        # Binary transfers have no terminator: 4 bytes per point
+        data_raw = self._inst._inst.read_bytes(4 * count)
+        return self._buffer_decode(data_raw, mode)
+
+    def _buffer_decode(self, data_raw, mode='binary'):
+        if mode == 'binary':
+            # IEEE float32, little endian
+            return np.frombuffer(data_raw, dtype='<f4')
+        elif mode == 'compact':
+            # 16 bits mantissa and 16 bits exponent: m * 2 ** (exp - 124)
+            data = np.frombuffer(data_raw, dtype='<i2').reshape(-1, 2)
+            return np.ldexp(data[:, 0].astype(np.float32), data[:, 1] - 124)
+        else:
+            raise ValueError('binary or compact')
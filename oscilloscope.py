@@ -4,7 +4,130 @@ import numpy as np
 from instruments import Instrument
 
 
+class CurveBuffer(object):
+    '''
+    Preallocated ring of traces with running mean and variance.
+
+    latest, mean and traces are views of the internal arrays: they are
+    not copied and change with the next trace added.
+    '''
+
+    def __init__(self, size, points):
+        self._ring = np.zeros([size, points], dtype=float)
+        self._mean = np.zeros(points, dtype=float)
+        self._m2 = np.zeros(points, dtype=float)
+        self._var = np.zeros(points, dtype=float)
+        self._delta = np.zeros(points, dtype=float)
+        self._step = np.zeros(points, dtype=float)
+        self._index = -1
+        self.count = 0
+
+    def add(self, codes, yze=0.0, ymu=1.0, yoff=0.0):
+        """ Scale codes into the next slot and update the statistics """
+        self._index = (self._index + 1) % len(self._ring)
+        row = self._ring[self._index]
+        np.subtract(codes, yoff, out=row)
+        row *= ymu
+        row += yze
+
+        # Welford update without temporary arrays
+        self.count += 1
+        np.subtract(row, self._mean, out=self._delta)
+        np.divide(self._delta, self.count, out=self._step)
+        self._mean += self._step
+        np.subtract(row, self._mean, out=self._step)
+        self._step *= self._delta
+        self._m2 += self._step
+        return row
+
+    @property
+    def latest(self):
+        return self._ring[self._index]
+
+    @property
+    def traces(self):
+        """ Stored traces in slot order, not in acquisition order """
+        return self._ring[:min(self.count, len(self._ring))]
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @property
+    def variance(self):
+        if self.count > 1:
+            np.divide(self._m2, self.count - 1, out=self._var)
+        return self._var
+
+    def reset(self):
+        self._mean[:] = 0
+        self._m2[:] = 0
+        self._var[:] = 0
+        self._index = -1
+        self.count = 0
+
+
+class Waveform(object):
+    '''
+    Raw curve codes with the preamble needed to scale them.
+
+    Time axis and volts are computed on access; slicing keeps the raw
+    codes and shifts the time origin, so traces stay at 1 or 2 bytes per
+    sample in memory and on disk.
+    '''
+
+    def __init__(self, codes, xze=0.0, xin=1.0, yze=0.0, ymu=1.0, yoff=0.0):
+        self.codes = np.asarray(codes)
+        self.xze = xze
+        self.xin = xin
+        self.yze = yze
+        self.ymu = ymu
+        self.yoff = yoff
+
+    @property
+    def preamble(self):
+        return self.xze, self.xin, self.yze, self.ymu, self.yoff
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self.codes))
+            return Waveform(self.codes[key], self.xze + start * self.xin,
+                            self.xin * step, self.yze, self.ymu, self.yoff)
+        return (self.codes[key] - self.yoff) * self.ymu + self.yze
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.y, dtype=dtype)
+
+    @property
+    def x(self):
+        return self.xze + np.arange(len(self.codes)) * self.xin
+
+    @property
+    def y(self):
+        return (self.codes - self.yoff) * self.ymu + self.yze
+
+    def save(self, fullname):
+        np.savez(fullname, codes=self.codes, preamble=self.preamble)
+
+    @classmethod
+    def load(cls, fullname):
+        with np.load(fullname) as data:
+            return cls(data['codes'], *data['preamble'])
+
+
 class Oscilloscope(Instrument):
+
+    # Command headers that change the waveform scaling
+    _scaling = ('CH', 'HOR', 'DAT', 'WFMP', 'SEL', 'AUTOS', 'FAC',
+                'RECA', '*RST', '*RCL')
+
+    # Curve datatype and byte order for each encoding and width
+    _encodings = {'RIB': ('b', 'h', True), 'RPB': ('B', 'H', True),
+                  'SRI': ('b', 'h', False), 'SRP': ('B', 'H', False)}
+
     def __init__(self, resource=None, sim_mode=False, backend="@py",
                  query='?*::INSTR', name=None, path='./'):
 
@@ -16,6 +139,9 @@ class Oscilloscope(Instrument):
         self._yze = None
         self._ymu = None
         self._yoff = None
+        self._data = dict()
+        self._preambles = dict()
+        self._wfid = None
 
         self.setup_curve()
         self.get_waveform_preamble()
@@ -23,11 +149,44 @@ class Oscilloscope(Instrument):
     def setup_curve(self, source='CH1', mode='RPB',
                     width=1, start=1, stop=2500):
 
-        self._inst.write('DATa:SOUrce {}'.format(source))
-        self._inst.write('DATa:ENC {}'.format(mode))
-        self._inst.write('DATa:WIDth {}'.format(width))
-        self._inst.write('DATa:STARt {}'.format(start))
-        self._inst.write('DATa:STOP {}'.format(stop))
+        settings = (('SOUrce', source), ('ENC', mode), ('WIDth', width),
+                    ('STARt', start), ('STOP', stop))
+
+        # Send only the settings that changed, in one message
+        commands = list()
+        for header, value in settings:
+            if self._data.get(header) != value:
+                commands.append(':DATa:{} {}'.format(header, value))
+                self._data[header] = value
+
+        if commands:
+            self._inst.write(';'.join(commands))
+            if len(commands) > 1 or not commands[0].startswith(':DATa:SOU'):
+                self._preambles.clear()
+            self._select_preamble()
+
+    def write(self, command, termination=None, encoding=None, log=True):
+        Instrument.write(self, command, termination, encoding, log)
+        header = command.lstrip(':').upper()
+        if header.startswith(self._scaling):
+            self._preambles.clear()
+        if header.startswith(('DAT', '*RST', '*RCL')):
+            # Curve settings are unknown, setup_curve sends them again
+            self._data.clear()
+
+    def waveform_changed(self):
+        """ Compare the short waveform description with the last one """
+        wfid = self._inst.query('WFMPRE:WFID?')
+        changed = wfid != self._wfid
+        self._wfid = wfid
+        return changed
+
+    def _select_preamble(self):
+        preamble = self._preambles.get(self._data.get('SOUrce'))
+        if preamble is not None:
+            (self._xze, self._xin,
+             self._yze, self._ymu, self._yoff) = preamble
+        return preamble is not None
 
     def get_waveform_preamble(self, log=False):
         query = 'WFMPRE:XZE?;XIN?;YZE?;YMU?;YOFF?;'
@@ -37,18 +196,116 @@ class Oscilloscope(Instrument):
         self._yze = answer[2]
         self._ymu = answer[3]
         self._yoff = answer[4]
+        self._preambles[self._data.get('SOUrce')] = (
+            self._xze, self._xin, self._yze, self._ymu, self._yoff)
 
-    def get_curve(self, auto_wfmpre=True, log=True):
-        if auto_wfmpre:
+    def _read_curve(self, auto_wfmpre=True, log=True):
+        if auto_wfmpre == 'detect' and self.waveform_changed():
+            self._preambles.clear()
+        if ((auto_wfmpre and not self._select_preamble()) or
+                auto_wfmpre == 'always'):
             self.get_waveform_preamble(log=log)
 
-        y = self._inst.query_binary_values('CURV?', datatype='B',
-                                           container=np.array)
-        y = (y - self._yoff) * self._ymu + self._yze
-        x = self._xze + np.arange(len(y)) * self._xin
+        if 'ENC' not in self._data or 'WIDth' not in self._data:
+            # Read back the curve format after DATa commands
+            encoding, width = self._inst.query('DATa:ENCdg?;WIDth?').split(';')
+            self._data['ENC'] = encoding.strip()[:3].upper()
+            self._data['WIDth'] = int(width)
+
+        narrow, wide, big = self._encodings[self._data['ENC']]
+        datatype = wide if self._data['WIDth'] == 2 else narrow
+        return self._inst.query_binary_values('CURV?', datatype=datatype,
+                                              is_big_endian=big,
+                                              container=np.array)
+
+    def get_curve(self, auto_wfmpre=True, log=True):
+        """
+        auto_wfmpre: True reads the preamble only after scaling commands,
+        'detect' also checks WFMPRE:WFID? for front panel changes,
+        'always' reads it every time and False never does.
+        """
+        waveform = self.get_waveform(auto_wfmpre, log)
+        return waveform.x, waveform.y
+
+    def get_waveform(self, auto_wfmpre=True, log=True):
+        """ Read the current source as a compact Waveform """
+        codes = self._read_curve(auto_wfmpre, log)
+        waveform = Waveform(codes, self._xze, self._xin,
+                            self._yze, self._ymu, self._yoff)
 
         if log:
-            save = self.save([x, y])
+            save = self.save(codes, 'waveform', command='CURV?',
+                             attrs={'preamble': waveform.preamble})
             self._log.time_stamp('CURV?', answer=save)
 
+        return waveform
+
+    def load_waveform(self, reference):
+        """ Load a Waveform saved by get_waveform or get_curve """
+        store, name = self._reference(reference)
+        return Waveform(store.read(name), *store.attrs(name)['preamble'])
+
+    def get_curves(self, sources=('CH1', 'CH2', 'CH3', 'CH4'), width=2,
+                   start=1, stop=2500, auto_wfmpre=True, raw=False,
+                   log=True):
+        """
+        Read several sources into one (channels, points) array.
+
+        Returns x and the volts, or with raw=True x, the codes and the
+        (yze, ymu, yoff) scale of each channel as a (channels, 3) array.
+        """
+        if len(sources) == 0:
+            raise ValueError('Expected at least one source')
+        mode = 'RIB' if width == 2 else 'RPB'
+        dtype = np.int16 if width == 2 else np.uint8
+        codes = None
+        scale = np.zeros([len(sources), 3], dtype=float)
+
+        for i, source in enumerate(sources):
+            self.setup_curve(source, mode, width, start, stop)
+            y = self._read_curve(auto_wfmpre, log=False)
+            if codes is None:
+                # The record may be shorter than stop - start + 1
+                codes = np.zeros([len(sources), len(y)], dtype=dtype)
+            if len(y) != codes.shape[1]:
+                raise ValueError('Expected {} points from {}, got {}'.format(
+                    codes.shape[1], source, len(y)))
+            codes[i] = y
+            scale[i] = self._yze, self._ymu, self._yoff
+
+        x = self._xze + np.arange(codes.shape[1]) * self._xin
+
+        if log:
+            command = 'CURV? {}'.format(', '.join(sources))
+            save = self.save(codes, 'curves', command=command)
+            self._log.time_stamp(command, answer=save)
+
+        if raw:
+            return x, codes, scale
+
+        y = (codes - scale[:, 2:3]) * scale[:, 1:2] + scale[:, 0:1]
         return x, y
+
+    def capture(self, count, size=16, buffer=None, auto_wfmpre=True,
+                log=True):
+        """ Acquire count traces of the current source into a CurveBuffer """
+        if buffer is None and count < 1:
+            raise ValueError('Expected count >= 1 without a buffer')
+
+        for i in range(count):
+            codes = self._read_curve(auto_wfmpre, log=False)
+            if buffer is None:
+                buffer = CurveBuffer(size, len(codes))
+            if len(codes) != len(buffer.mean):
+                raise ValueError('Expected {} points, got {}'.format(
+                    len(buffer.mean), len(codes)))
+            buffer.add(codes, self._yze, self._ymu, self._yoff)
+
+        if log:
+            x = self._xze + np.arange(len(buffer.mean)) * self._xin
+            command = 'CURV? x{}'.format(buffer.count)
+            save = self.save(np.vstack([x, buffer.mean, buffer.variance]),
+                             'capture', command=command)
+            self._log.time_stamp(command, answer=save)
+
+        return buffer
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class SweepScheduler(object):
+    '''
+    Run actions of several instruments as a dependency graph.
+
+    Steps are added in order, each one after the steps it depends on.
+    For every point of the sweep the steps without pending dependencies
+    run concurrently; steps on the same resource are serialized. Steps
+    that depend on some axes only run when their indices change. Results
+    of steps with a shape are stored in preallocated N-dimensional arrays
+    indexed by the sweep axes.
+    '''
+
+    def __init__(self):
+        self._steps = OrderedDict()
+        self._locks = dict()
+        self._answers = dict()
+        self.results = dict()
+
+    def add(self, name, func, after=(), resource=None, shape=None,
+            dtype=float, axes=None):
+        """
+        Add step func(point) to run after the steps in after.
+
+        With axes the step only runs when the index of one of those axes
+        changes, its last result is kept for the other points.
+        """
+        if name in self._steps:
+            raise ValueError('Step {} already exists'.format(name))
+        if isinstance(after, str):
+            after = (after,)
+        for dep in after:
+            if dep not in self._steps:
+                raise ValueError('Unknown step {}'.format(dep))
+        if isinstance(axes, str):
+            axes = (axes,)
+
+        if resource is not None and id(resource) not in self._locks:
+            self._locks[id(resource)] = threading.Lock()
+
+        self._steps[name] = {'func': func,
+                             'after': tuple(after),
+                             'resource': resource,
+                             'shape': shape,
+                             'dtype': dtype,
+                             'axes': None if axes is None else tuple(axes)}
+
+    def run(self, **axes):
+        """ Run the graph for every combination of the axes values """
+        names = list(axes.keys())
+        values = [np.asarray(axes[name]) for name in names]
+        shape = tuple(len(v) for v in values)
+        for name, step in self._steps.items():
+            for axis in step['axes'] or ():
+                if axis not in axes:
+                    raise ValueError('Unknown axis {} in step {}'.format(
+                        axis, name))
+
+        self.results = dict()
+        for name, step in self._steps.items():
+            if step['shape'] is not None:
+                self.results[name] = np.zeros(shape + tuple(step['shape']),
+                                              dtype=step['dtype'])
+
+        self._answers = dict()
+        workers = max(len(self._steps), 1)
+        previous = None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for index in np.ndindex(*shape):
+                point = {name: v[i] for name, v, i in
+                         zip(names, values, index)}
+                changed = {name for name, i, j in
+                           zip(names, index, previous or index)
+                           if previous is None or i != j}
+                self._run_point(executor, index, point, changed)
+                previous = index
+
+        return self.results
+
+    def _run_point(self, executor, index, point, changed):
+        futures = OrderedDict()
+        for name, step in self._steps.items():
+            if step['axes'] is not None and not changed & set(step['axes']):
+                # Same indices as the last run: repeat its result
+                if step['shape'] is not None:
+                    self.results[name][index] = self._answers[name]
+                continue
+            deps = [futures[dep] for dep in step['after'] if dep in futures]
+            futures[name] = executor.submit(self._run_step, name, step,
+                                            deps, index, point)
+        for future in futures.values():
+            future.result()
+
+    def _run_step(self, name, step, deps, index, point):
+        for dep in deps:
+            dep.result()
+
+        resource = step['resource']
+        if resource is None:
+            answer = step['func'](point)
+        else:
+            with self._locks[id(resource)]:
+                answer = step['func'](point)
+
+        self._answers[name] = answer
+        if step['shape'] is not None:
+            self.results[name][index] = answer
+        return answer
@@ -0,0 +1,550 @@
+# -*- coding: utf-8 -*-
+
+import math
+import re
+import time
+
+import numpy as np
+
+
+class SimDevice(object):
+    '''
+    Non interactive VISA resource emulator.
+
+    Keeps the device state, answers every message like the instrument
+    would and waits latency seconds per transaction plus the transfer
+    time of each message at bandwidth bytes per second.
+    '''
+
+    idn = 'Simulated VISA Device,SimDevice,0,0'
+
+    # Queries of one message share a ';' separated reply (SCPI)
+    _joined_answers = True
+
+    def __init__(self, latency=0.0, bandwidth=None, seed=None):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._rng = np.random.RandomState(seed)
+        self._pending = b''
+        self._responses = list()
+        self._esr = 0
+        self.transactions = 0
+        self.bytes = 0
+        self.reset()
+
+    def reset(self):
+        self._settings = dict()
+
+    # Transport
+
+    def _transfer(self, size):
+        self.transactions += 1
+        self.bytes += size
+        wait = self.latency
+        if self.bandwidth:
+            wait += size / self.bandwidth
+        if wait > 0:
+            time.sleep(wait)
+
+    def write(self, command, termination=None, encoding=None):
+        self._transfer(len(command))
+        answers = list()
+        for header, args, query in self._split(command):
+            answer = self._dispatch(header, args, query)
+            if query and answer is not None:
+                answers.append(answer)
+
+        if len(answers) == 1 and isinstance(answers[0], bytes):
+            self._responses = answers
+        elif answers and self._joined_answers:
+            self._responses = [(';'.join(answers) + '\n').encode()]
+        else:
+            self._responses = [a if isinstance(a, bytes) else
+                               (a + '\n').encode() for a in answers]
+        self._pending = self._responses.pop(0) if self._responses else b''
+
+    def _next_response(self):
+        if not self._pending and self._responses:
+            self._pending = self._responses.pop(0)
+
+    def write_raw(self, message):
+        self.write(message.decode())
+
+    def read_raw(self, size=None):
+        self._next_response()
+        data, self._pending = self._pending, b''
+        self._transfer(len(data))
+        return data
+
+    def read_bytes(self, count, chunk_size=None, break_on_termchar=False):
+        self._next_response()
+        data = self._pending[:count]
+        self._pending = self._pending[count:]
+        self._transfer(len(data))
+        return data
+
+    def read(self):
+        return self.read_raw().decode().rstrip('\n')
+
+    def query(self, command, delay=None):
+        self.write(command)
+        return self.read()
+
+    @staticmethod
+    def from_ascii_block(text, converter='f', separator=',',
+                         container=list):
+        """ Same as pyvisa.util.from_ascii_block for float answers """
+        values = text.strip().strip(separator).split(separator)
+        return container([float(v) for v in values])
+
+    def query_ascii_values(self, command, converter='f', separator=',',
+                           container=list, delay=None):
+        return self.from_ascii_block(self.query(command, delay), converter,
+                                     separator, container)
+
+    def query_binary_values(self, command, datatype='f',
+                            is_big_endian=False, container=list,
+                            delay=None, header_fmt='ieee'):
+        self.write(command)
+        data = self.read_raw()
+        if header_fmt == 'ieee' and data[:1] == b'#':
+            digits = int(data[1:2])
+            size = int(data[2:2 + digits])
+            data = data[2 + digits:2 + digits + size]
+        dtype = np.dtype(datatype).newbyteorder('>' if is_big_endian
+                                                else '<')
+        return container(np.frombuffer(data, dtype=dtype))
+
+    def close(self):
+        pass
+
+    # Parsing
+
+    def _split(self, message):
+        for part in message.strip().split(';'):
+            part = part.strip()
+            if part == '':
+                continue
+            match = re.match(r'([^\s?]+)(\?)?\s*(.*)', part)
+            header, query, args = match.groups()
+            args = [a.strip() for a in args.split(',') if a.strip() != '']
+            yield header.upper(), args, query is not None
+
+    def _dispatch(self, header, args, query):
+        if header == '*IDN':
+            return self.idn
+        if header == '*RST':
+            self.reset()
+            return None
+        if header == '*ESR':
+            self._update_status()
+            esr, self._esr = self._esr, 0
+            return str(esr)
+        if header == '*CLS':
+            self._esr = 0
+            return None
+        return self.handle(header, args, query)
+
+    def _update_status(self):
+        pass
+
+    def handle(self, header, args, query):
+        """ Answer a message unit, returns None for writes """
+        self.illegal()
+
+    def illegal(self):
+        # Command error bit of the standard event register
+        self._esr |= 32
+
+    def out_of_range(self):
+        # Execution error bit of the standard event register
+        self._esr |= 16
+
+
+class SimSR830(SimDevice):
+    '''
+    SR830 lock-in emulator.
+
+    The input signal is a resonance around f0 seen through the output
+    low pass filter, so readings settle with the time constant.
+    '''
+
+    idn = 'Stanford_Research_Systems,SR830,s/n00000,ver1.07'
+
+    # Each query of a message is answered with its own terminator
+    _joined_answers = False
+
+    _defaults = {'ISRC': '0', 'IGND': '0', 'ICPL': '0', 'ILIN': '0',
+                 'SENS': '22', 'RMOD': '1', 'OFLT': '6', 'OFSL': '1',
+                 'SYNC': '0', 'FMOD': '1', 'FREQ': '1000.000',
+                 'PHAS': '0.00', 'SLVL': '1.000', 'HARM': '1',
+                 'RSLP': '0', 'LOCL': '0', 'OUTX': '1', 'SRAT': '10',
+                 'SEND': '1', 'DDEF 1': '0,0', 'DDEF 2': '0,0',
+                 'FPOP 1': '0', 'FPOP 2': '0', 'OEXP 1': '0.00,0',
+                 'OEXP 2': '0.00,0', 'OEXP 3': '0.00,0',
+                 'AUXV 1': '0.000', 'AUXV 2': '0.000', 'AUXV 3': '0.000',
+                 'AUXV 4': '0.000'}
+
+    # Settings addressed by a channel number
+    _indexed = ('DDEF', 'FPOP', 'OEXP', 'AUXV')
+
+    _sens = (2e-9, 5e-9, 10e-9, 20e-9, 50e-9, 100e-9, 200e-9, 500e-9,
+             1e-6, 2e-6, 5e-6, 10e-6, 20e-6, 50e-6, 100e-6, 200e-6, 500e-6,
+             1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, 200e-3, 500e-3,
+             1)
+
+    _oflt = (10e-6, 30e-6, 100e-6, 300e-6, 1e-3, 3e-3, 10e-3, 30e-3,
+             100e-3, 300e-3, 1.0, 3.0, 10.0, 30.0, 100.0, 300.0,
+             1e3, 3e3, 10e3, 30e3)
+
+    _srat = (0.0625, 0.125, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0,
+             64.0, 128.0, 256.0, 512.0)
+
+    def __init__(self, latency=0.0, bandwidth=None, seed=None, f0=1000.0,
+                 q=50.0, gain=1e-3, noise=1e-3, auto_time=0.0, srq=False):
+        self.f0 = f0
+        self.q = q
+        self.gain = gain
+        self.noise = noise
+        self.auto_time = auto_time
+        if srq:
+            # Like a VISA backend with events, others have no wait_for_srq
+            self.wait_for_srq = self._wait_for_srq
+        SimDevice.__init__(self, latency, bandwidth, seed)
+
+    def reset(self):
+        self._settings = dict(self._defaults)
+        self._out = self._target()
+        self._changed = time.monotonic()
+        self._busy = 0.0
+        self._opc = None
+        self._lias = 0
+        self._buffer_start = None
+        self._buffer_stop = None
+
+    # Signal model
+
+    def _target(self):
+        f = float(self._settings['FREQ']) * int(self._settings['HARM'])
+        ampl = float(self._settings['SLVL'])
+        phase = np.deg2rad(float(self._settings['PHAS']))
+        z = self.gain * ampl / (1 + 1j * self.q * (f / self.f0 - self.f0 / f))
+        return z * np.exp(-1j * phase)
+
+    def _settle(self):
+        # Restart the filter response from the current output
+        now = time.monotonic()
+        self._out = self._output(now)
+        self._changed = now
+
+    def _output(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        tc = self._oflt[int(self._settings['OFLT'])]
+        order = int(self._settings['OFSL']) + 1
+        x = (now - self._changed) / tc
+        # Step response of cascaded single pole filters
+        remain = np.exp(-x) * sum(x ** k / math.factorial(k)
+                                  for k in range(order))
+        target = self._target()
+        return target + (self._out - target) * remain
+
+    def _outputs(self, count=1):
+        z = self._output()
+        scale = self.noise * abs(self.gain)
+        z = z + scale * (self._rng.randn(count) + 1j * self._rng.randn(count))
+        return {1: z.real, 2: z.imag, 3: np.abs(z),
+                4: np.rad2deg(np.angle(z))}
+
+    def _snap(self, i):
+        if 1 <= i <= 4:
+            return self._outputs()[i][0]
+        if 5 <= i <= 8:
+            return 0.0
+        if i == 9:
+            return float(self._settings['FREQ'])
+        if i in (10, 11):
+            return self._display(i - 9)[0]
+        self.out_of_range()
+        return 0.0
+
+    def _display(self, display, count=1):
+        outputs = self._outputs(count)
+        mode = int(float(self._settings['DDEF {}'.format(display)]
+                         .split(',')[0]))
+        if display == 1:
+            return outputs[1] if mode == 0 else outputs[3]
+        return outputs[2] if mode == 0 else outputs[4]
+
+    # Buffer
+
+    def _stored(self):
+        if self._buffer_start is None:
+            return 0
+        end = self._buffer_stop or time.monotonic()
+        rate = self._srat[int(self._settings['SRAT'])]
+        count = int((end - self._buffer_start) * rate)
+        if self._settings['SEND'] == '0':
+            count = min(count, 16383)
+        return count
+
+    def _trace(self, header, args):
+        display, start, count = (int(a) for a in args)
+        if start + count > min(self._stored(), 16383):
+            self.out_of_range()
+            return ''
+        data = self._display(display, count).astype('<f4')
+        if header == 'TRCA':
+            return ','.join('{:e}'.format(v) for v in data) + ','
+        if header == 'TRCB':
+            return data.tobytes()
+        mant, exp = np.frexp(data.astype(float))
+        exp = exp - 15
+        mant = np.clip(np.round(np.ldexp(mant, 15)), -32768, 32767)
+        mant = mant.astype('<i2')
+        return np.column_stack([mant, (exp + 124).astype('<i2')]).tobytes()
+
+    def fill_buffer(self, points=16383):
+        """ Pretend points have already been stored in the buffer """
+        rate = self._srat[int(self._settings['SRAT'])]
+        self._buffer_stop = time.monotonic()
+        self._buffer_start = self._buffer_stop - points / rate
+
+    # Commands
+
+    def handle(self, header, args, query):
+        if header in self._indexed and args:
+            key = '{} {}'.format(header, args[0])
+            args = args[1:]
+        else:
+            key = header
+
+        if key in self._settings:
+            if query:
+                return self._settings[key]
+            if header in ('FREQ', 'HARM', 'SLVL', 'PHAS', 'OFLT', 'OFSL'):
+                self._settle()
+            self._settings[key] = ','.join(args)
+            return None
+
+        if header == 'OUTP' and query:
+            return '{:e}'.format(self._snap(int(args[0])))
+        if header == 'OUTR' and query:
+            return '{:e}'.format(self._display(int(args[0]))[0])
+        if header == 'SNAP' and query:
+            return ','.join('{:e}'.format(self._snap(int(a))) for a in args)
+        if header == 'OAUX' and query:
+            return '0.000'
+        if header == 'SPTS' and query:
+            return str(self._stored())
+        if header in ('TRCA', 'TRCB', 'TRCL') and query:
+            return self._trace(header, args)
+        if header == '*STB' and query:
+            idle = time.monotonic() >= self._busy
+            return '1' if idle or args != ['1'] else '0'
+        if header == 'LIAS' and query:
+            lias, self._lias = self._lias, 0
+            return str(lias)
+        if header in ('AGAN', 'ARSV', 'APHS', 'AOFF'):
+            self._auto(header)
+            return None
+        if header == 'REST':
+            self._buffer_start = None
+            self._buffer_stop = None
+            return None
+        if header == 'STRT':
+            now = time.monotonic()
+            if self._buffer_start is None:
+                self._buffer_start = now
+            elif self._buffer_stop is not None:
+                # Resume after PAUS
+                self._buffer_start += now - self._buffer_stop
+            self._buffer_stop = None
+            return None
+        if header == 'PAUS':
+            self._buffer_stop = time.monotonic()
+            return None
+        if header == '*OPC' and not query:
+            # Operation complete when the running auto function ends
+            self._opc = self._busy
+            return None
+        if header in ('SSET', 'RSET', '*SRE', '*ESE', 'ERRE', 'LIAE'):
+            return None
+
+        self.illegal()
+        return None
+
+    def _update_status(self):
+        if self._opc is not None and time.monotonic() >= self._opc:
+            self._esr |= 1
+            self._opc = None
+
+    def _wait_for_srq(self, timeout=25000):
+        """ Wait the service request of *OPC, timeout in ms """
+        if self._opc is None:
+            raise TimeoutError('No operation pending')
+        wait = self._opc - time.monotonic()
+        if wait > timeout / 1000:
+            time.sleep(timeout / 1000)
+            raise TimeoutError('Service request timeout')
+        time.sleep(max(wait, 0))
+        self._update_status()
+
+    def _auto(self, header):
+        self._busy = time.monotonic() + self.auto_time
+        r = abs(self._output())
+        if header == 'AGAN':
+            sens = [i for i, s in enumerate(self._sens) if s > r]
+            self._settings['SENS'] = str(sens[0] if sens else 26)
+        elif header == 'APHS':
+            phase = float(self._settings['PHAS'])
+            phase += np.rad2deg(np.angle(self._output()))
+            self._settings['PHAS'] = '{:.2f}'.format(phase)
+            self._settle()
+
+
+class SimTDS(SimDevice):
+    '''
+    Tektronix TDS oscilloscope emulator (DATa, WFMPre and CURVe).
+
+    Headers are matched by their first three letters plus any channel
+    number, so short and long forms are both accepted.
+    '''
+
+    idn = 'TEKTRONIX,TDS 2024B,C000000,CF:91.1CT FV:v22.11'
+
+    def reset(self):
+        self._settings = {'DAT:SOU': 'CH1', 'DAT:ENC': 'RPB',
+                          'DAT:WID': '1', 'DAT:STA': '1',
+                          'DAT:STO': '2500', 'HOR:SCA': '5.0E-4'}
+        for ch in range(1, 5):
+            self._settings['CH{}:SCA'.format(ch)] = '1.0E0'
+            self._settings['CH{}:POS'.format(ch)] = '0.0E0'
+
+    def _split(self, message):
+        path = list()
+        for header, args, query in SimDevice._split(self, message):
+            if header.startswith('*'):
+                yield header, args, query
+                continue
+            nodes = [self._short(n) for n in header.split(':') if n]
+            if not header.startswith(':') and path:
+                # Relative to the previous header
+                nodes = path[:-1] + nodes
+            path = nodes
+            yield ':'.join(nodes), args, query
+
+    def _short(self, node):
+        match = re.match(r'([A-Z]*)(\d*)', node.upper())
+        return match.group(1)[:3] + match.group(2)
+
+    def _preamble(self):
+        source = self._settings['DAT:SOU']
+        width = int(self._settings['DAT:WID'])
+        scale = float(self._settings['{}:SCA'.format(source)])
+        position = float(self._settings['{}:POS'.format(source)])
+        hscale = float(self._settings['HOR:SCA'])
+        ymu = scale / 25.0 / 256 ** (width - 1)
+        yoff = -position * 25.0 * 256 ** (width - 1)
+        if self._settings['DAT:ENC'] in ('RPB', 'SRP'):
+            yoff += 2 ** (8 * width - 1)
+        return {'XZE': -5 * hscale, 'XIN': hscale / 250.0,
+                'YZE': 0.0, 'YMU': ymu, 'YOF': yoff}
+
+    def _curve(self):
+        source = self._settings['DAT:SOU']
+        width = int(self._settings['DAT:WID'])
+        start = int(self._settings['DAT:STA'])
+        stop = int(self._settings['DAT:STO'])
+        pre = self._preamble()
+
+        t = pre['XZE'] + np.arange(start - 1, stop) * pre['XIN']
+        freq = 1e3 * int(source[-1]) if source[-1].isdigit() else 1e3
+        volts = np.sin(2 * np.pi * freq * t) + 0.01 * self._rng.randn(len(t))
+        codes = np.round(volts / pre['YMU'] + pre['YOF'])
+
+        encoding = self._settings['DAT:ENC']
+        signed = encoding in ('RIB', 'SRI')
+        dtype = {(1, True): 'i1', (1, False): 'u1',
+                 (2, True): 'i2', (2, False): 'u2'}[(width, signed)]
+        info = np.iinfo(dtype)
+        order = '>' if encoding in ('RIB', 'RPB') else '<'
+        data = np.clip(codes, info.min, info.max).astype(order + dtype)
+        data = data.tobytes()
+        size = str(len(data))
+        return '#{}{}'.format(len(size), size).encode() + data + b'\n'
+
+    def handle(self, header, args, query):
+        if header in self._settings:
+            if query:
+                return self._settings[header]
+            self._settings[header] = args[0] if args else ''
+            return None
+        if header.startswith('WFM') and query:
+            field = header.split(':')[-1]
+            if field == 'WFI':
+                return '"{}, DC coupling, {} V/div, {} s/div"'.format(
+                    self._settings['DAT:SOU'],
+                    self._settings['{}:SCA'.format(
+                        self._settings['DAT:SOU'])],
+                    self._settings['HOR:SCA'])
+            if field in self._preamble():
+                return '{:e}'.format(self._preamble()[field])
+        if header == 'CUR' and query:
+            return self._curve()
+        if header in ('AUTOS', 'SEL', 'ACQ', 'RECA', 'FAC'):
+            return None
+        self.illegal()
+        return None
+
+
+class SimITC4001(SimDevice):
+    '''
+    Thorlabs ITC4001 emulator (MEASure and SOURce subsystems).
+
+    Temperature follows the setpoint with a first order response.
+    '''
+
+    idn = 'Thorlabs,ITC4001,M00000000,1.8.0/1.5.0/2.3.0'
+
+    def __init__(self, latency=0.0, bandwidth=None, seed=None, tau=5.0):
+        self.tau = tau
+        SimDevice.__init__(self, latency, bandwidth, seed)
+
+    def reset(self):
+        self._settings = {'SOU:CUR': '0.0', 'SOU2:TEM': '25.0'}
+        self._temp = 25.0
+        self._changed = time.monotonic()
+
+    def _temperature(self):
+        setpoint = float(self._settings['SOU2:TEM'])
+        x = (time.monotonic() - self._changed) / self.tau
+        return setpoint + (self._temp - setpoint) * np.exp(-x)
+
+    def _key(self, header):
+        nodes = list()
+        for node in header.split(':'):
+            match = re.match(r'([A-Z]*)(\d*)', node)
+            nodes.append(match.group(1)[:3] + match.group(2))
+        return ':'.join(nodes)
+
+    def handle(self, header, args, query):
+        key = self._key(header)
+        if key in ('MEA:TEM', 'MEA'):
+            return '{:.4f}'.format(self._temperature())
+        if key == 'MEA:CUR':
+            return self._settings['SOU:CUR']
+        if key in self._settings:
+            if query:
+                return self._settings[key]
+            value = args[0].lower().rstrip('c') if args else '0'
+            if key == 'SOU2:TEM':
+                self._temp = self._temperature()
+                self._changed = time.monotonic()
+            self._settings[key] = value
+            return None
+        self.illegal()
+        return None
+
+
+SIMULATORS = {'SR830': SimSR830, 'TDS': SimTDS, 'ITC4001': SimITC4001}
@@ -1,8 +1,17 @@
 # -*- coding: utf-8 -*-
 
+import atexit
+import io
+import json
+import math
 import os
 import shutil
+import struct
+import threading
 import time
+import weakref
+
+import numpy as np
 
 
 class FileTools():
@@ -89,6 +98,318 @@ class FileTools():
         return newlist, changes
 
 
+class DataStore():
+    '''
+    Append-only container for the arrays saved along a session.
+
+    Each record is a JSON header (name, command, timestamp, dtype, shape)
+    followed by the array in .npy format. Appends never scan the disk and
+    records are read back by seeking to their offset.
+    '''
+
+    def __init__(self, fullname):
+        self._file = fullname
+        self._fobj = None
+        self._index = dict()
+        self._counters = dict()
+        self._lock = threading.Lock()
+
+        if os.path.isfile(fullname):
+            self._scan()
+
+    def __del__(self):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def filename(self):
+        return self._file
+
+    @property
+    def index(self):
+        return self._index
+
+    def _scan(self):
+        with open(self._file, 'rb') as f:
+            offset = 0
+            head = f.read(4)
+            while len(head) == 4:
+                size, = struct.unpack('<I', head)
+                entry = json.loads(f.read(size).decode())
+                entry['offset'] = offset + 4 + size
+                self._index[entry['name']] = entry
+                offset = entry['offset'] + entry['size']
+                f.seek(offset)
+                head = f.read(4)
+
+    def _newname(self, name):
+        i = self._counters.get(name, 0)
+        while name + str(i) in self._index:
+            i += 1
+        self._counters[name] = i + 1
+        return name + str(i)
+
+    def append(self, data, name='temp', command=None, attrs=None):
+        """ Store data and return the name assigned to the record """
+        try:
+            data = np.asanyarray(data)
+        except ValueError:
+            # Ragged sequences are kept as object arrays
+            items = data
+            data = np.empty(len(items), dtype=object)
+            for i, item in enumerate(items):
+                data[i] = item
+
+        payload = io.BytesIO()
+        np.lib.format.write_array(payload, data, allow_pickle=True)
+        payload = payload.getvalue()
+
+        with self._lock:
+            name = self._newname(name)
+            entry = {'name': name,
+                     'command': command,
+                     'timestamp': time.time(),
+                     'dtype': str(data.dtype),
+                     'shape': list(data.shape),
+                     'size': len(payload)}
+            if attrs is not None:
+                entry['attrs'] = attrs
+            header = json.dumps(entry).encode()
+
+            if self._fobj is None:
+                dirname = os.path.dirname(self._file)
+                if dirname != '':
+                    os.makedirs(dirname, exist_ok=True)
+                self._fobj = open(self._file, 'ab')
+
+            offset = self._fobj.seek(0, os.SEEK_END)
+            self._fobj.write(struct.pack('<I', len(header)) + header)
+            self._fobj.write(payload)
+            self._fobj.flush()
+
+            entry['offset'] = offset + 4 + len(header)
+            self._index[name] = entry
+
+        return name
+
+    def attrs(self, name):
+        """ Extra attributes stored with a record """
+        return self._index[name].get('attrs', dict())
+
+    def read(self, name):
+        """ Read a stored record by name """
+        entry = self._index[name]
+        with open(self._file, 'rb') as f:
+            f.seek(entry['offset'])
+            return np.lib.format.read_array(f, allow_pickle=True)
+
+    def close(self):
+        with self._lock:
+            if self._fobj is not None:
+                self._fobj.close()
+                self._fobj = None
+
+
+class MappedRows():
+    '''
+    Growable .npy file of fixed width rows written through a memory map.
+
+    Only the current chunk of rows is mapped, so memory stays bounded
+    however long the file grows. The header is rewritten on every chunk
+    and on flush, so the file can be opened with numpy.load while rows
+    are still being added.
+    '''
+
+    # Fixed header size, large enough for any row count
+    HEADER = 128
+
+    def __init__(self, fullname, columns, dtype='<f8', chunk=4096):
+        self._file = fullname
+        self._columns = columns
+        self._dtype = np.dtype(dtype)
+        self._chunk = chunk
+        self._rowsize = self._dtype.itemsize * columns
+        self._lock = threading.Lock()
+        self._map = None
+        self._base = 0
+        self.count = 0
+
+        dirname = os.path.dirname(fullname)
+        if dirname != '':
+            os.makedirs(dirname, exist_ok=True)
+        self._fobj = open(fullname, 'w+b')
+        self._fobj.write(self._header(0))
+        self._remap()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def filename(self):
+        return self._file
+
+    @property
+    def closed(self):
+        return self._fobj is None
+
+    def _header(self, rows):
+        header = ("{{'descr': {!r}, 'fortran_order': False, "
+                  "'shape': ({}, {}), }}").format(self._dtype.str, rows,
+                                                   self._columns)
+        header = header.ljust(self.HEADER - 11) + '\n'
+        return (b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) +
+                header.encode('latin1'))
+
+    def _write_header(self):
+        self._fobj.seek(0)
+        self._fobj.write(self._header(self.count))
+        self._fobj.flush()
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map = None
+        self._base = self.count
+        self._fobj.truncate(self.HEADER +
+                            (self._base + self._chunk) * self._rowsize)
+        self._map = np.memmap(self._fobj, dtype=self._dtype, mode='r+',
+                              offset=self.HEADER + self._base *
+                              self._rowsize,
+                              shape=(self._chunk, self._columns))
+        self._write_header()
+
+    def next_row(self):
+        """ Writable view of the next row, added to the file by commit """
+        if self.count - self._base == self._chunk:
+            with self._lock:
+                self._remap()
+        return self._map[self.count - self._base]
+
+    def commit(self):
+        self.count += 1
+
+    def append(self, row):
+        self.next_row()[:] = row
+        self.commit()
+
+    def flush(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.flush()
+                self._write_header()
+
+    def view(self, start=0, stop=None):
+        """ Read-only map of the committed rows, not a copy """
+        stop = self.count if stop is None else min(stop, self.count)
+        if stop <= start:
+            return np.zeros([0, self._columns], dtype=self._dtype)
+        return np.memmap(self._file, dtype=self._dtype, mode='r',
+                         offset=self.HEADER + start * self._rowsize,
+                         shape=(stop - start, self._columns))
+
+    def close(self):
+        """ Flush and trim the file to the committed rows """
+        with self._lock:
+            if self._fobj is None:
+                return
+            self._map.flush()
+            self._map = None
+            self._write_header()
+            self._fobj.truncate(self.HEADER + self.count * self._rowsize)
+            self._fobj.close()
+            self._fobj = None
+
+
+class Profiler():
+    '''
+    Latency histograms, call counts and bytes transferred per command.
+
+    Latencies are counted in logarithmic bins (bins_per_decade from 1 us),
+    so memory use does not grow with the number of calls.
+    '''
+
+    def __init__(self, bins_per_decade=10):
+        self._bins = bins_per_decade
+        self._stats = dict()
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds, sent=0, received=0):
+        i = max(int(math.log10(max(seconds, 1e-6) * 1e6) * self._bins), 0)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = {'calls': 0, 'total': 0.0, 'min': seconds,
+                         'max': seconds, 'sent': 0, 'received': 0,
+                         'histogram': dict()}
+                self._stats[key] = stats
+            stats['calls'] += 1
+            stats['total'] += seconds
+            stats['min'] = min(stats['min'], seconds)
+            stats['max'] = max(stats['max'], seconds)
+            stats['sent'] += sent
+            stats['received'] += received
+            stats['histogram'][i] = stats['histogram'].get(i, 0) + 1
+
+    def _percentile(self, histogram, calls, q):
+        # Upper edge of the bin holding the q quantile
+        count = 0
+        for i in sorted(histogram):
+            count += histogram[i]
+            if count >= q * calls:
+                return 1e-6 * 10 ** ((i + 1) / self._bins)
+
+    def report(self):
+        """ One row per command, slowest total time first """
+        rows = list()
+        with self._lock:
+            for key, stats in self._stats.items():
+                row = {'command': key}
+                row.update({k: v for k, v in stats.items()
+                            if k != 'histogram'})
+                row['mean'] = stats['total'] / stats['calls']
+                for q in (0.5, 0.9, 0.99):
+                    # Bin edges can fall outside the measured range
+                    value = self._percentile(stats['histogram'],
+                                             stats['calls'], q)
+                    row['p{:g}'.format(q * 100)] = min(
+                        max(value, stats['min']), stats['max'])
+                rows.append(row)
+        return sorted(rows, key=lambda row: row['total'], reverse=True)
+
+    def table(self):
+        template = '{:<16.16} {:>8} {:>10} {:>10} {:>10} {:>10} {:>12}'
+        lines = [template.format('command', 'calls', 'total s', 'mean ms',
+                                 'p90 ms', 'max ms', 'bytes')]
+        for row in self.report():
+            lines.append(template.format(
+                row['command'], row['calls'], '{:.3f}'.format(row['total']),
+                '{:.3f}'.format(row['mean'] * 1e3),
+                '{:.3f}'.format(row['p90'] * 1e3),
+                '{:.3f}'.format(row['max'] * 1e3),
+                row['sent'] + row['received']))
+        return '\n'.join(lines)
+
+    def dump(self, fullname):
+        """ Save report and histograms as JSON """
+        with self._lock:
+            histograms = {key: {str(i): n for i, n in
+                                stats['histogram'].items()}
+                          for key, stats in self._stats.items()}
+        with open(fullname, 'w') as f:
+            json.dump({'bins_per_decade': self._bins,
+                       'report': self.report(),
+                       'histograms': histograms}, f, indent=1)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
 class PromptTools():
 
     @classmethod
@@ -123,21 +444,148 @@ class PromptTools():
 
 class LogTools():
 
-    def __init__(self, filename, if_exist='a'):
-        self._file = filename
-
-    def time_stamp(self, message=None, answer=None, style='%X'):
-        with open(self._file, 'a') as f:
-            if message is not None:
-                f.write(time.strftime(style) + " >> " + message + '\n')
-            if answer is not None:
-                f.write(' ' * 8 + ' << {} \n'.format(answer))
-            f.write('\n')
+    DEBUG = 10
+    INFO = 20
+    WARNING = 30
 
-    def annontate(self, comment, style='%X'):
-        with open(self._file, 'a') as f:
-            f.write(time.strftime(style) + " ## " + comment + '\n')
-            f.write('\n')
+    def __init__(self, filename, if_exist='a', buffered=False,
+                 flush_size=256, flush_interval=1.0, level=10, sampling=1):
+        self._file = filename
+        self._fobj = None
+        self._records = list()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._count = 0
+        self._stamp = (None, None, None)
+
+        self.configure(buffered, flush_size, flush_interval, level, sampling)
+
+    def __del__(self):
+        self.close()
+
+    def configure(self, buffered=None, flush_size=None, flush_interval=None,
+                  level=None, sampling=None):
+        """ Change buffering, level filter or sampling of records """
+        if flush_size is not None:
+            self._flush_size = max(int(flush_size), 1)
+        if flush_interval is not None:
+            self._flush_interval = float(flush_interval)
+        if level is not None:
+            self._level = level
+        if sampling is not None:
+            # Keep one of every n DEBUG records
+            self._sampling = max(int(sampling), 1)
+
+        if buffered is None:
+            return
+        elif buffered and self._thread is None:
+            self._stop.clear()
+            # The thread and atexit only keep a weak reference, so the
+            # log is still closed (and flushed) when it is collected
+            ref = weakref.ref(self)
+            self._thread = threading.Thread(target=self._flush_loop,
+                                            args=(ref, self._stop),
+                                            daemon=True)
+            self._thread.start()
+            atexit.register(self._close_ref, ref)
+        elif not buffered and self._thread is not None:
+            self._stop_thread()
+            self.flush()
+            self._close_file()
+
+    def flush(self):
+        """ Write pending records to file """
+        with self._lock:
+            records, self._records = self._records, list()
+            if records:
+                if self._fobj is None:
+                    self._fobj = open(self._file, 'a')
+                self._fobj.write(''.join(records))
+            if self._fobj is not None:
+                self._fobj.flush()
+
+    def close(self):
+        """ Flush pending records and release the file """
+        self._stop_thread()
+        self.flush()
+        self._close_file()
+
+    def _stop_thread(self):
+        if self._thread is not None:
+            self._stop.set()
+            if self._thread is not threading.current_thread():
+                self._thread.join()
+            self._thread = None
+
+    def _close_file(self):
+        with self._lock:
+            if self._fobj is not None:
+                self._fobj.close()
+                self._fobj = None
+
+    @staticmethod
+    def _flush_loop(ref, stop):
+        while True:
+            log = ref()
+            if log is None:
+                return
+            interval = log._flush_interval
+            del log
+            if stop.wait(interval):
+                return
+            log = ref()
+            if log is None:
+                return
+            log.flush()
+            del log
+
+    @staticmethod
+    def _close_ref(ref):
+        log = ref()
+        if log is not None:
+            log.close()
+
+    def _accept(self, level):
+        if level < self._level:
+            return False
+        if level <= self.DEBUG and self._sampling > 1:
+            self._count += 1
+            return self._count % self._sampling == 1
+        return True
+
+    def _write(self, text):
+        if self._thread is None:
+            with open(self._file, 'a') as f:
+                f.write(text)
+        else:
+            with self._lock:
+                self._records.append(text)
+                full = len(self._records) >= self._flush_size
+            if full:
+                self.flush()
+
+    def _strftime(self, style):
+        # Format the clock once per second
+        now = int(time.time())
+        if self._stamp[0] != now or self._stamp[1] != style:
+            self._stamp = (now, style, time.strftime(style))
+        return self._stamp[2]
+
+    def time_stamp(self, message=None, answer=None, style='%X', level=20):
+        if not self._accept(level):
+            return
+        text = ''
+        if message is not None:
+            text += self._strftime(style) + " >> " + message + '\n'
+        if answer is not None:
+            text += ' ' * 8 + ' << {} \n'.format(answer)
+        self._write(text + '\n')
+
+    def annontate(self, comment, style='%X', level=20):
+        if not self._accept(level):
+            return
+        self._write(self._strftime(style) + " ## " + comment + '\n\n')
 
     def block(self, *args, border='#', inside=' ', align='<', width=70):
 
@@ -148,19 +596,17 @@ class LogTools():
                   'a': align,
                   'w': width - 4}
 
-        with open(self._file, 'a') as f:
-            f.write(border * width + '\n')
-            for line in args:
-                f.write(template.format(line, **params) + '\n')
-            f.write(border * width + '\n\n')
+        text = border * width + '\n'
+        for line in args:
+            text += template.format(line, **params) + '\n'
+        text += border * width + '\n\n'
+        self._write(text)
 
     def underline(self, text, style='-'):
-        with open(self._file, 'a') as f:
-            f.write(text + '\n')
-            f.write(style * len(text) + '\n\n')
+        self._write(text + '\n' + style * len(text) + '\n\n')
 
     def tabulated_lines(self, lines, tab=4, space=' '):
-        with open(self._file, 'a') as f:
-            for line in lines:
-                f.write(space * tab + line + '\n')
-            f.write('\n')
+        text = ''
+        for line in lines:
+            text += space * tab + line + '\n'
+        self._write(text + '\n')